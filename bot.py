@@ -681,7 +681,7 @@ from html import escape
 from typing import Set, Tuple, Dict, cast, List
 
 import config
-from main import App, load_symbols_universe, make_pairs, fmt_full, age_sec
+from main import App, load_symbols_universe, make_pairs, fmt_full, age_sec, install_fast_loop
 from get_all_coins import write_full_universe
 
 from telegram import Update
@@ -798,6 +798,15 @@ async def _safe_send(bot, chat_id: int, text: str, *, parse_mode=ParseMode.HTML)
 
 
 # ========= Background setup & monitor =========
+async def _shutdown_core(application: Application):
+    """
+    Runs once on shutdown: stop the streams and close the shared HTTP session.
+    """
+    app = application.bot_data.get("app")
+    if app is not None:
+        await app.aclose()
+
+
 async def _setup_core(context: ContextTypes.DEFAULT_TYPE):
     """
     Runs once on startup: prepare universe, load markets, start streams.
@@ -1341,7 +1350,9 @@ def main():
     if not TOKEN:
         raise SystemExit('Set TELEGRAM_BOT_TOKEN first:  $env:TELEGRAM_BOT_TOKEN = "YOUR_TOKEN"')
 
-    application = Application.builder().token(TOKEN).build()
+    install_fast_loop()  # before PTB creates its loop, so run_polling() gets uvloop
+
+    application = Application.builder().token(TOKEN).post_shutdown(_shutdown_core).build()
 
     # commands
     application.add_handler(CommandHandler("start", cmd_start))
@@ -1,7 +1,7 @@
-import asyncio, json, os, time, importlib, sys, math, contextlib
-from dataclasses import dataclass
+import asyncio, json, os, time, importlib, sys, math, contextlib, hashlib
 from typing import Dict, List, Tuple, Optional, Set, Callable
 from decimal import Decimal, ROUND_DOWN, InvalidOperation, getcontext
+import aiohttp
 from rich.live import Live
 from rich.table import Table
 from rich.panel import Panel
@@ -17,22 +17,27 @@ console = Console()
 # =========================
 # ====== DATA TYPES =======
 # =========================
-@dataclass
 class Quote:
-    bid: Optional[float] = None
-    ask: Optional[float] = None
-    bid_sz: Optional[float] = None
-    ask_sz: Optional[float] = None
-    bid_str: Optional[str] = None
-    ask_str: Optional[str] = None
-    ts_ms: int = 0
+    # slotted like the markets' _QuoteCompat: no per-instance __dict__
+    __slots__ = ("bid","ask","bid_sz","ask_sz","bid_str","ask_str","ts_ms")
+    def __init__(self, bid: Optional[float] = None, ask: Optional[float] = None,
+                 bid_sz: Optional[float] = None, ask_sz: Optional[float] = None,
+                 bid_str: Optional[str] = None, ask_str: Optional[str] = None, ts_ms: int = 0):
+        self.bid, self.ask = bid, ask
+        self.bid_sz, self.ask_sz = bid_sz, ask_sz
+        self.bid_str, self.ask_str = bid_str, ask_str
+        self.ts_ms = ts_ms
 
 def now_ms() -> int:
-    return int(time.time() * 1000)
+    # wall clock as an int; every market stamps quotes with the same clock
+    return time.time_ns() // 1_000_000
 
-def age_sec(ts_ms: int) -> float:
+def age_sec(ts_ms: int, nms: Optional[int] = None) -> float:
+    """Age of a quote stamp in seconds; pass nms to reuse one clock read per frame."""
     if ts_ms <= 0: return math.inf
-    return max(0.0, (now_ms() - ts_ms) / 1000.0)
+    if nms is None:
+        nms = now_ms()
+    return max(0.0, (nms - ts_ms) / 1000.0)
 
 # =========================
 # ====== FORMATTERS  ======
@@ -139,12 +144,19 @@ def pairs_key(pairs: List[str]) -> Tuple[str, ...]:
     """Stable key for comparing desired pair sets."""
     return tuple(sorted(set(pairs)))
 
+def universe_fingerprint(path: str) -> Tuple[int, str]:
+    """(size, sha256) of the raw universe file, to detect byte-identical refreshes."""
+    with open(path, "rb") as f:
+        raw = f.read()
+    return len(raw), hashlib.sha256(raw).hexdigest()
+
 # =========================
 # ====== MARKET API =======
 # =========================
 class MarketBase:
     name: str = "base"
     on_quote: Optional[Callable[[str, Quote], None]] = None
+    http: Optional[aiohttp.ClientSession] = None  # shared app session (set by main)
 
     async def discover(self, desired_pairs: List[str]) -> Set[str]:
         raise NotImplementedError
@@ -155,35 +167,44 @@ class MarketBase:
 # =========================
 # ====== ARB STATE  =======
 # =========================
-@dataclass
-class ArbState:
-    in_window: bool = False
-    since_ms: Optional[int] = None
-
-arb_states: Dict[Tuple[str,str,str], ArbState] = {}
+# Hysteresis state per (pair, buy_mkt, sell_mkt) key, kept as two parallel
+# arrays indexed by a dense id handed out the first time a key is seen.
+arb_ids: Dict[Tuple[str,str,str], int] = {}
+arb_in_window: List[bool] = []
+arb_since_ms: List[int] = []   # 0 while not in window
 
 THRESH_ENTER = config.THRESH_ENTER_PCT / 100.0
 THRESH_EXIT  = config.THRESH_EXIT_PCT  / 100.0
 
+def _arb_id(key: Tuple[str,str,str]) -> int:
+    i = arb_ids.get(key)
+    if i is None:
+        i = arb_ids[key] = len(arb_in_window)
+        arb_in_window.append(False)
+        arb_since_ms.append(0)
+    return i
+
 def update_hysteresis(key: Tuple[str,str,str], profit_frac: float, nowms: int) -> bool:
-    st = arb_states.get(key)
-    if st is None:
-        st = ArbState(); arb_states[key] = st
-    if not st.in_window:
+    i = arb_ids.get(key)
+    if i is None:
+        if profit_frac < THRESH_ENTER:
+            return False  # never entered: no state to allocate
+        i = _arb_id(key)
+    if not arb_in_window[i]:
         if profit_frac >= THRESH_ENTER:
-            st.in_window = True
-            st.since_ms = nowms
+            arb_in_window[i] = True
+            arb_since_ms[i] = nowms
     else:
         if profit_frac < THRESH_EXIT:
-            st.in_window = False
-            st.since_ms = None
-    return st.in_window
+            arb_in_window[i] = False
+            arb_since_ms[i] = 0
+    return arb_in_window[i]
 
 def is_long(key: Tuple[str,str,str], nowms: int) -> bool:
-    st = arb_states.get(key)
-    if not st or not st.in_window or st.since_ms is None:
+    i = arb_ids.get(key)
+    if i is None or not arb_in_window[i]:
         return False
-    return (nowms - st.since_ms) >= (config.LONG_SECS * 1000)
+    return (nowms - arb_since_ms[i]) >= (config.LONG_SECS * 1000)
 
 # =========================
 # ====== KEY INPUT   ======
@@ -257,9 +278,11 @@ class App:
         self.supported: Dict[str, Set[str]] = {}
         self.view: str = "active"
         self.page: int = 0
+        self.http: Optional[aiohttp.ClientSession] = None
 
         # dynamic state for hot-reload
         self.current_pairs_key: Tuple[str, ...] = tuple()
+        self._universe_fingerprint: Optional[Tuple[int, str]] = None
         self.market_task: Optional[asyncio.Task] = None
         self.refresher_task: Optional[asyncio.Task] = None
         self.stop_event = asyncio.Event()
@@ -268,10 +291,16 @@ class App:
         self.prices.setdefault(market, {})[pair] = q
 
     async def load_markets(self):
+        # one pooled HTTP session for every market's REST calls
+        if self.http is None or self.http.closed:
+            self.http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=100, ttl_dns_cache=300)
+            )
         for name in config.MARKETS_TO_USE:
             mod = importlib.import_module(f"markets.{name}")
             market: MarketBase = mod.MARKET_CLASS()
             market.on_quote = lambda pair, q, mkt=name: self.on_quote(mkt, pair, q)
+            market.http = self.http
             self.markets[name] = market
             self.prices[name] = {}
 
@@ -331,12 +360,15 @@ class App:
                 for m_sell, q_sell in avail:
                     if m_sell == m_buy or q_sell.bid is None or q_sell.bid_sz is None:
                         continue
+                    key = (pair, m_buy, m_sell)
+                    # no spread: skip the division unless an open window may need closing
+                    if q_sell.bid <= q_buy.ask and key not in arb_ids:
+                        continue
                     profit_frac = (q_sell.bid - q_buy.ask) / q_buy.ask
                     profit_pct = profit_frac * 100.0
                     if profit_pct > config.MAX_PROFIT_PCT:
                         continue
 
-                    key = (pair, m_buy, m_sell)
                     active = update_hysteresis(key, profit_frac, nms)
                     if not active:
                         continue
@@ -358,8 +390,8 @@ class App:
                         "sell_qty": sell_qty,
                         "exec_qty": exec_qty,
                         "qty": exec_qty,
-                        "buy_age": age_sec(q_buy.ts_ms),
-                        "sell_age": age_sec(q_sell.ts_ms),
+                        "buy_age": age_sec(q_buy.ts_ms, nms),
+                        "sell_age": age_sec(q_sell.ts_ms, nms),
                         "long": is_long(key, nms),
                     }
                     ops.append(op)
@@ -369,9 +401,10 @@ class App:
 
     def list_stale(self) -> List[Tuple[str, str, float, Quote]]:
         stale = []
+        nms = now_ms()
         for mkt, pairs in self.prices.items():
             for pair, q in pairs.items():
-                a = age_sec(q.ts_ms)
+                a = age_sec(q.ts_ms, nms)
                 if a >= config.STALE_SECS:
                     stale.append((mkt, pair, a, q))
         stale.sort(key=lambda x: (-x[2], x[0], x[1]))
@@ -519,6 +552,14 @@ class App:
                 console.print(f"[bold red]Universe refresh failed:[/] {e}")
                 continue  # keep running with old universe
 
+            # skip reparsing when the refreshed file is byte-identical
+            # (mtime always moves on rewrite, so compare size + content hash)
+            fp = universe_fingerprint(config.COINS_UNIVERSE_FILE)
+            if fp == self._universe_fingerprint:
+                console.print("[cyan]Universe file unchanged — no reload needed.[/]")
+                continue
+            self._universe_fingerprint = fp
+
             # 2) recompute desired pairs
             new_bases = load_symbols_universe(
                 config.COINS_UNIVERSE_FILE,
@@ -592,6 +633,7 @@ class App:
         await self.load_markets()
 
         # 2) build initial pairs
+        self._universe_fingerprint = universe_fingerprint(config.COINS_UNIVERSE_FILE)
         bases = load_symbols_universe(
             config.COINS_UNIVERSE_FILE,
             config.COINS_RANK_RANGE,
@@ -614,23 +656,39 @@ class App:
         try:
             await self.ui_loop()  # blocks until 'Q'
         finally:
-            self.stop_event.set()
-            # cancel background & markets
-            if self.refresher_task:
-                self.refresher_task.cancel()
-            if self.market_task and not self.market_task.done():
-                self.market_task.cancel()
-
-            # best-effort cleanup
-            with contextlib.suppress(Exception):
-                if self.refresher_task: await self.refresher_task
-            with contextlib.suppress(Exception):
-                if self.market_task: await self.market_task
+            await self.aclose()
+
+    async def aclose(self):
+        """Stop the refresher and market tasks and close the shared HTTP session."""
+        self.stop_event.set()
+        # cancel background & markets
+        if self.refresher_task:
+            self.refresher_task.cancel()
+        if self.market_task and not self.market_task.done():
+            self.market_task.cancel()
+
+        # best-effort cleanup; awaiting a cancelled task raises CancelledError (a BaseException)
+        with contextlib.suppress(asyncio.CancelledError, Exception):
+            if self.refresher_task: await self.refresher_task
+        with contextlib.suppress(asyncio.CancelledError, Exception):
+            if self.market_task: await self.market_task
+        with contextlib.suppress(Exception):
+            if self.http: await self.http.close()
 
 # =========================
 # ========= BOOT ==========
 # =========================
+def install_fast_loop() -> bool:
+    """Make uvloop the asyncio loop if it is installed (it is not on Windows)."""
+    try:
+        import uvloop
+    except ImportError:
+        return False
+    uvloop.install()
+    return True
+
 if __name__ == "__main__":
+    install_fast_loop()
     try:
         asyncio.run(App().run())
     except KeyboardInterrupt:
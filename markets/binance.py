@@ -21,7 +21,7 @@ class _QuoteCompat:
         self.ts_ms = ts_ms
 
 def now_ms() -> int:
-    return int(time.time() * 1000)
+    return time.time_ns() // 1_000_000
 
 def chunked(seq, n):
     return [seq[i:i+n] for i in range(0, len(seq), n)]
@@ -29,6 +29,7 @@ def chunked(seq, n):
 class BinanceMarket:
     name = "binance"
     on_quote: Optional[Callable[[str, _QuoteCompat], None]] = None
+    http: Optional[aiohttp.ClientSession] = None  # shared session (set by main)
 
     # Tunables (edit if needed)
     SUB_BATCH = 60
@@ -37,22 +38,31 @@ class BinanceMarket:
     PING_INTERVAL = 20
     PING_TIMEOUT = 20
     MAX_SIZE = 2**22
+    FLUSH_INTERVAL = 0.02     # seconds between batched on_quote deliveries
 
     def __init__(self):
-        pass
+        # latest quote per pair since the last flush
+        self._pending: Dict[str, _QuoteCompat] = {}
 
     @staticmethod
     def _pair_to_binance(pair: str) -> str:
         return pair.replace("/", "").upper()
 
+    async def _get_json(self, url: str, timeout: int):
+        """GET url through the shared session, or a one-off session if none was given."""
+        if self.http is not None and not self.http.closed:
+            async with self.http.get(url, timeout=timeout) as r:
+                return await r.json()
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url, timeout=timeout) as r:
+                return await r.json()
+
     async def discover(self, desired_pairs: List[str]) -> Set[str]:
         """Filter desired_pairs to those tradable on Binance."""
         url = "https://api.binance.com/api/v3/exchangeInfo"
         ok: Set[str] = set()
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=20) as r:
-                    j = await r.json()
+            j = await self._get_json(url, timeout=20)
             for sym in j.get("symbols", []):
                 if sym.get("status") != "TRADING":
                     continue
@@ -65,46 +75,65 @@ class BinanceMarket:
             print("[binance][discover] error:", e)
         return ok
 
+    def _handle_message(self, msg, stream_to_pair: Dict[str, str]) -> None:
+        """Parse one combined-stream depth frame and emit its top-of-book."""
+        try:
+            data = json.loads(msg)
+        except:
+            return
+        stream = data.get("stream") or ""
+        d = data.get("data", {})
+        # map back to pair via the stream prefix (e.g. "btcusdt@depth5@100ms")
+        if stream:
+            pair = stream_to_pair.get(stream.split("@", 1)[0])
+        else:
+            pair = stream_to_pair.get((d.get("s") or "").lower())
+        if not pair:
+            return
+        bids = d.get("bids") or d.get("b") or []
+        asks = d.get("asks") or d.get("a") or []
+        if not bids or not asks:
+            return
+        try:
+            bpx_str, bs_str = bids[0][0], bids[0][1]
+            apx_str, as_str = asks[0][0], asks[0][1]
+            bpx, apx = float(bpx_str), float(apx_str)
+            bs,  a_s = float(bs_str), float(as_str)
+        except:
+            return
+        q = _QuoteCompat(
+            bid=bpx, ask=apx,
+            bid_sz=bs, ask_sz=a_s,
+            bid_str=bpx_str, ask_str=apx_str,
+        )
+        self._pending[pair] = q  # ts_ms is stamped at flush time
+
+    async def _flusher(self):
+        """Deliver the newest quote per pair once per FLUSH_INTERVAL."""
+        while True:
+            await asyncio.sleep(self.FLUSH_INTERVAL)
+            if not self._pending or not self.on_quote:
+                continue
+            pending, self._pending = self._pending, {}
+            on_quote = self.on_quote
+            ts = now_ms()  # one clock read per flush, not per frame
+            for pair, q in pending.items():
+                q.ts_ms = ts
+                on_quote(pair, q)
+
     async def _consume(self, batch: List[str]):
-        streams = "/".join(f"{self._pair_to_binance(p).lower()}@depth{self.DEPTH_LEVELS}@{self.DEPTH_INTERVAL}" for p in batch)
+        # stream prefix ("btcusdt") -> pair, built once per batch
+        stream_to_pair = {self._pair_to_binance(p).lower(): p for p in batch}
+        streams = "/".join(f"{sym}@depth{self.DEPTH_LEVELS}@{self.DEPTH_INTERVAL}" for sym in stream_to_pair)
         url = f"wss://stream.binance.com:9443/stream?streams={streams}"
+        handle = self._handle_message
         while True:
             try:
                 async with websockets.connect(
                     url, ping_interval=self.PING_INTERVAL, ping_timeout=self.PING_TIMEOUT, max_size=self.MAX_SIZE
                 ) as ws:
                     async for msg in ws:
-                        try:
-                            data = json.loads(msg)
-                        except:
-                            continue
-                        stream = data.get("stream") or ""
-                        d = data.get("data", {})
-                        sym_lc = stream.split("@", 1)[0] if stream else ""
-                        sym_uc = sym_lc.upper() if sym_lc else d.get("s")
-                        # map back to pair
-                        pair = next((p for p in batch if self._pair_to_binance(p) == sym_uc), None)
-                        if not pair: 
-                            continue
-                        bids = d.get("bids") or d.get("b") or []
-                        asks = d.get("asks") or d.get("a") or []
-                        if not bids or not asks:
-                            continue
-                        try:
-                            bpx_str, bs_str = bids[0][0], bids[0][1]
-                            apx_str, as_str = asks[0][0], asks[0][1]
-                            bpx, apx = float(bpx_str), float(apx_str)
-                            bs,  a_s = float(bs_str), float(as_str)
-                        except:
-                            continue
-                        q = _QuoteCompat(
-                            bid=bpx, ask=apx,
-                            bid_sz=bs, ask_sz=a_s,
-                            bid_str=bpx_str, ask_str=apx_str,
-                            ts_ms=now_ms()
-                        )
-                        if self.on_quote:
-                            self.on_quote(pair, q)
+                        handle(msg, stream_to_pair)
             except Exception as e:
                 print("[binance] reconnecting after error:", e)
                 await asyncio.sleep(3)
@@ -113,7 +142,7 @@ class BinanceMarket:
         if not pairs:
             return
         batches = chunked(sorted(pairs), self.SUB_BATCH)
-        await asyncio.gather(*(self._consume(b) for b in batches))
+        await asyncio.gather(self._flusher(), *(self._consume(b) for b in batches))
 
 # Entry point class for main.py
 def MARKET_CLASS():
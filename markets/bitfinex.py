@@ -1,6 +1,15 @@
 # markets/bitfinex.py
-import asyncio, aiohttp, websockets, json, time
+import asyncio, aiohttp, websockets, json, time, zlib
 from typing import List, Set, Dict, Optional, Callable, Tuple
+from sortedcontainers import SortedDict
+
+try:
+    import orjson
+    loads, dumps = orjson.loads, orjson.dumps
+except ImportError:  # stdlib fallback
+    loads = json.loads
+    def dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
 
 # ---------- Quote-compatible object (same fields main expects) ----------
 class _QuoteCompat:
@@ -12,7 +21,7 @@ class _QuoteCompat:
         self.ts_ms = ts_ms
 
 def now_ms() -> int:
-    return int(time.time() * 1000)
+    return time.time_ns() // 1_000_000
 
 def chunked(seq, n):
     return [seq[i:i+n] for i in range(0, len(seq), n)]
@@ -40,12 +49,14 @@ def _bfx_symbol_from_pair(pair: str) -> str:
 class BitfinexMarket:
     name = "bitfinex"
     on_quote: Optional[Callable[[str, _QuoteCompat], None]] = None
+    http: Optional[aiohttp.ClientSession] = None  # shared session (set by main)
 
     # Tunables
     SUB_BATCH = 35
     MAX_SIZE = 2**22
     PING_INTERVAL = 20
     PING_TIMEOUT = 20
+    QUOTE_REFRESH_MS = 5000  # re-emit an unchanged top at least this often so ages stay live
     BFX_BOOK_PREC = "P0"     # P0..P3
     BFX_BOOK_FREQ = "F0"     # F0 (realtime) or F1 (~2s)
     BFX_BOOK_LEN  = 25       # 1,25,100
@@ -53,6 +64,15 @@ class BitfinexMarket:
     WS_URL = "wss://api-pub.bitfinex.com/ws/2"
 
     # ---------- Discovery ----------
+    async def _get_json(self, url: str, timeout: int):
+        """GET url through the shared session, or a one-off session if none was given."""
+        if self.http is not None and not self.http.closed:
+            async with self.http.get(url, timeout=timeout) as r:
+                return await r.json()
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url, timeout=timeout) as r:
+                return await r.json()
+
     async def discover(self, desired_pairs: List[str]) -> Set[str]:
         """
         Return subset of desired_pairs supported on Bitfinex spot; cache pair->symbol.
@@ -60,9 +80,7 @@ class BitfinexMarket:
         ok: Set[str] = set()
         mapping: Dict[str, str] = {}
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.REST_CONF, timeout=20) as r:
-                    j = await r.json()
+            j = await self._get_json(self.REST_CONF, timeout=20)
             # response like: [["BTCUSD","ETHUST",...]]
             if not (isinstance(j, list) and j and isinstance(j[0], list)):
                 raise ValueError("Bad Bitfinex conf response")
@@ -81,8 +99,22 @@ class BitfinexMarket:
 
     # ---------- Consumer ----------
     async def _consume(self, batch: List[str]):
-        # books[pair] = {"bids": {price: (count, amount)}, "asks": {...}}
-        books: Dict[str, Dict[str, Dict[float, Tuple[int, float]]]] = {}
+        # book sides per pair: SortedDict{price: size}
+        bids_by_pair: Dict[str, SortedDict] = {}
+        asks_by_pair: Dict[str, SortedDict] = {}
+        # last emitted (bid, ask, bid_sz, ask_sz) per pair and when it was sent
+        last_top: Dict[str, Tuple[Tuple, int]] = {}
+        # bfx symbol -> pair, inverted once for subscribing and resolving acks
+        sym_to_pair = {self._pair_to_bfxsym[p]: p for p in batch if p in self._pair_to_bfxsym}
+        # subscribe frames are fixed per batch: encode them once, not on every reconnect
+        sub_frames = [dumps({
+            "event": "subscribe",
+            "channel": "book",
+            "symbol": sym,
+            "prec": self.BFX_BOOK_PREC,
+            "freq": self.BFX_BOOK_FREQ,
+            "len": self.BFX_BOOK_LEN,
+        }) for sym in sym_to_pair]
 
         while True:
             try:
@@ -91,27 +123,25 @@ class BitfinexMarket:
                     ping_interval=self.PING_INTERVAL,
                     ping_timeout=self.PING_TIMEOUT,
                     max_size=self.MAX_SIZE,
+                    compression=None,
                 ) as ws:
                     chan_to_pair: Dict[int, str] = {}
-                    # subscribe per symbol
-                    for p in batch:
-                        sym = self._pair_to_bfxsym.get(p)
-                        if not sym:
+                    for p in sym_to_pair.values():
+                        bids_by_pair[p] = SortedDict(); asks_by_pair[p] = SortedDict()
+                    # subscribe per symbol; frames go out together instead of one await each
+                    await asyncio.gather(*(ws.send(f, text=True) for f in sub_frames))
+
+                    while True:
+                        # raw frame bytes go straight to the parser: no UTF-8 decode to str first
+                        try:
+                            raw = await ws.recv(decode=False)
+                        except websockets.ConnectionClosedOK:
+                            break
+                        # heartbeats ([chanId,"hb"]) carry nothing we read: skip the decode
+                        if raw.endswith(b'"hb"]'):
                             continue
-                        msg = {
-                            "event": "subscribe",
-                            "channel": "book",
-                            "symbol": sym,
-                            "prec": self.BFX_BOOK_PREC,
-                            "freq": self.BFX_BOOK_FREQ,
-                            "len": self.BFX_BOOK_LEN,
-                        }
-                        await ws.send(json.dumps(msg))
-                        books[p] = {"bids": {}, "asks": {}}
-
-                    async for raw in ws:
                         try:
-                            msg = json.loads(raw)
+                            msg = loads(raw)
                         except Exception:
                             continue
 
@@ -119,9 +149,9 @@ class BitfinexMarket:
                         if isinstance(msg, dict):
                             if msg.get("event") == "subscribed" and msg.get("channel") == "book":
                                 sym = msg.get("symbol")
-                                pair = next((p for p in batch if self._pair_to_bfxsym.get(p) == sym), None)
+                                pair = sym_to_pair.get(sym)
                                 if pair:
-                                    chan_to_pair[int(msg["chanId"])] = pair
+                                    chan_to_pair[msg["chanId"]] = pair
                             # ignore other events
                             continue
 
@@ -129,7 +159,7 @@ class BitfinexMarket:
                         if not (isinstance(msg, list) and len(msg) >= 2):
                             continue
                         chan_id, payload = msg[0], msg[1]
-                        pair = chan_to_pair.get(int(chan_id))
+                        pair = chan_to_pair.get(chan_id)
                         if not pair:
                             continue
                         if payload == "hb":
@@ -138,53 +168,55 @@ class BitfinexMarket:
                         # snapshot (list of lists) or single update (3-tuple)
                         if isinstance(payload, list) and payload and isinstance(payload[0], list):
                             # snapshot
-                            bids, asks = {}, {}
-                            for entry in payload:
-                                try:
-                                    price = float(entry[0]); count = int(entry[1]); amount = float(entry[2])
-                                except:
-                                    continue
-                                if count == 0:
-                                    continue
-                                if amount > 0:
-                                    bids[price] = (count, amount)
-                                elif amount < 0:
-                                    asks[price] = (count, amount)
-                            books[pair]["bids"], books[pair]["asks"] = bids, asks
+                            bids, asks = SortedDict(), SortedDict()
+                            try:
+                                # entries are [price, count, amount]; amount < 0 marks an ask
+                                for price, count, amount in payload:
+                                    if count == 0 or amount == 0:
+                                        continue
+                                    (bids if amount > 0 else asks)[price] = abs(amount)
+                            except (TypeError, ValueError):
+                                continue
+                            bids_by_pair[pair], asks_by_pair[pair] = bids, asks
 
                         elif isinstance(payload, list) and len(payload) == 3:
                             # single level update
-                            try:
-                                price = float(payload[0]); count = int(payload[1]); amount = float(payload[2])
-                            except:
-                                continue
-                            side = "bids" if amount > 0 else "asks"
+                            price, count, amount = payload
+                            side = bids_by_pair[pair] if amount > 0 else asks_by_pair[pair]
                             if count > 0:
-                                books[pair][side][price] = (count, amount)
+                                side[price] = abs(amount)
                             else:
-                                books[pair][side].pop(price, None)
+                                side.pop(price, None)
                         else:
                             continue
 
                         # derive top-of-book
-                        bids = books[pair]["bids"]; asks = books[pair]["asks"]
-                        best_bid = max(bids.keys()) if bids else None
-                        best_ask = min(asks.keys()) if asks else None
+                        bids = bids_by_pair[pair]; asks = asks_by_pair[pair]
+                        best_bid = bids.keys()[-1] if bids else None
+                        best_ask = asks.keys()[0] if asks else None
                         if best_bid is None and best_ask is None:
                             continue
 
-                        bid_sz = abs(bids[best_bid][1]) if best_bid is not None else None
-                        ask_sz = abs(asks[best_ask][1]) if best_ask is not None else None
+                        bid_sz = bids[best_bid] if best_bid is not None else None
+                        ask_sz = asks[best_ask] if best_ask is not None else None
+
+                        # skip the emit when only deeper levels moved
+                        top = (best_bid, best_ask, bid_sz, ask_sz)
+                        ts = now_ms()
+                        prev = last_top.get(pair)
+                        if prev is not None and prev[0] == top and ts - prev[1] < self.QUOTE_REFRESH_MS:
+                            continue
+                        last_top[pair] = (top, ts)
 
-                        # keep raw strings for full precision printing
-                        bid_str = f"{best_bid:.12f}" if best_bid is not None else None
-                        ask_str = f"{best_ask:.12f}" if best_ask is not None else None
+                        # shortest round-trip repr: exact for display, no fixed 12-digit padding
+                        bid_str = repr(best_bid) if best_bid is not None else None
+                        ask_str = repr(best_ask) if best_ask is not None else None
 
                         q = _QuoteCompat(
                             bid=best_bid, ask=best_ask,
                             bid_sz=bid_sz, ask_sz=ask_sz,
                             bid_str=bid_str, ask_str=ask_str,
-                            ts_ms=now_ms(),
+                            ts_ms=ts,
                         )
                         if self.on_quote:
                             self.on_quote(pair, q)
@@ -203,7 +235,8 @@ class BitfinexMarket:
 
         if not pairs:
             return
-        batches = chunked(sorted(pairs), self.SUB_BATCH)
+        # order by a stable hash instead of alphabetically, so busy pairs spread across sockets
+        batches = chunked(sorted(pairs, key=lambda p: zlib.crc32(p.encode())), self.SUB_BATCH)
         await asyncio.gather(*(self._consume(b) for b in batches))
 
 # Entry point factory for main.py
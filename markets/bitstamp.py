@@ -1,6 +1,15 @@
 # markets/bitstamp.py
-import asyncio, aiohttp, websockets, json, time
+import asyncio, aiohttp, websockets, json, time, zlib
 from typing import List, Set, Dict, Optional, Callable, Tuple
+from sortedcontainers import SortedDict
+
+try:
+    import orjson
+    loads, dumps = orjson.loads, orjson.dumps
+except ImportError:  # stdlib fallback
+    loads = json.loads
+    def dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
 
 # ---------- Quote-compatible object (same fields main expects) ----------
 class _QuoteCompat:
@@ -12,7 +21,7 @@ class _QuoteCompat:
         self.ts_ms = ts_ms
 
 def now_ms() -> int:
-    return int(time.time() * 1000)
+    return time.time_ns() // 1_000_000
 
 def chunked(seq, n):
     return [seq[i:i+n] for i in range(0, len(seq), n)]
@@ -24,25 +33,35 @@ def _sym_bs(pair: str) -> str:
 class BitstampMarket:
     name = "bitstamp"
     on_quote: Optional[Callable[[str, _QuoteCompat], None]] = None
+    http: Optional[aiohttp.ClientSession] = None  # shared session (set by main)
 
     # Tunables
     SUB_BATCH = 50
     MAX_SIZE = 2**22
     PING_INTERVAL = 20
     PING_TIMEOUT = 20
+    FULL_BOOK = False  # True: also take the diff channel and maintain a local book
+    QUOTE_REFRESH_MS = 5000  # re-emit an unchanged top at least this often so ages stay live
     REST_PAIRS = "https://www.bitstamp.net/api/v2/trading-pairs-info/"
     WS_URL = "wss://ws.bitstamp.net"
 
     # ---------- Discovery ----------
+    async def _get_json(self, url: str, timeout: int):
+        """GET url through the shared session, or a one-off session if none was given."""
+        if self.http is not None and not self.http.closed:
+            async with self.http.get(url, timeout=timeout) as r:
+                return await r.json()
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url, timeout=timeout) as r:
+                return await r.json()
+
     async def discover(self, desired_pairs: List[str]) -> Set[str]:
         """
         Return subset of desired_pairs that exist on Bitstamp (by url_symbol).
         """
         ok: Set[str] = set()
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.REST_PAIRS, timeout=20) as r:
-                    arr = await r.json()
+            arr = await self._get_json(self.REST_PAIRS, timeout=20)
             url_syms = set()
             for it in arr if isinstance(arr, list) else []:
                 sym = (it.get("url_symbol") or "").lower().strip()
@@ -57,40 +76,47 @@ class BitstampMarket:
 
     # ---------- Helpers ----------
     @staticmethod
-    def _set_level(side: str, book: Dict[str, Dict[str, float]], price: float, size: float):
-        levels = book['bids'] if side == "buy" else book['asks']
-        k = f"{price:.12f}"
-        if size == 0.0:
-            levels.pop(k, None)
-        else:
-            levels[k] = size
+    def _apply_levels(levels: SortedDict, rows) -> None:
+        # rows are [price_str, size_str]; a zero size removes the level.
+        # One call per side keeps the per-level work in a single tight loop.
+        pop = levels.pop
+        for pr, sz in rows:
+            size = float(sz)
+            if size == 0.0:
+                pop(float(pr), None)
+            else:
+                levels[float(pr)] = size
 
     @staticmethod
-    def _best_levels(book: Dict[str, Dict[str, float]]) -> Tuple[Optional[Tuple[float,float]], Optional[Tuple[float,float]]]:
-        bids = book['bids']; asks = book['asks']
-        best_bid = None
-        if bids:
-            pb = max((float(p) for p,s in bids.items() if s > 0.0), default=None)
-            if pb is not None:
-                best_bid = (pb, bids[f"{pb:.12f}"])
-        best_ask = None
-        if asks:
-            pa = min((float(p) for p,s in asks.items() if s > 0.0), default=None)
-            if pa is not None:
-                best_ask = (pa, asks[f"{pa:.12f}"])
+    def _best_levels(bids: SortedDict, asks: SortedDict) -> Tuple[Optional[Tuple[float,float]], Optional[Tuple[float,float]]]:
+        # sides are SortedDicts keyed by float price; _apply_levels drops zero sizes
+        best_bid = bids.peekitem(-1) if bids else None
+        best_ask = asks.peekitem(0) if asks else None
         return best_bid, best_ask
 
     # ---------- Consumer ----------
     async def _consume(self, batch: List[str]):
-        symbols = [_sym_bs(p) for p in batch]
-        # book store per pair: {"bids": {price_str: size}, "asks": {...}}
-        books: Dict[str, Dict[str, Dict[str, float]]] = {p: {"bids": {}, "asks": {}} for p in batch}
-
-        # build all subscribe frames (snapshot + diff per symbol)
+        # url symbol -> pair, built once instead of scanning the batch per message
+        sym_to_pair = {_sym_bs(p): p for p in batch}
+        symbols = list(sym_to_pair)
+        # channel -> (pair, is_diff), so frames resolve without rebuilding the symbol
+        chan_to_pair: Dict[str, Tuple[str, bool]] = {}
+        for s, p in sym_to_pair.items():
+            chan_to_pair[f"order_book_{s}"] = (p, False)
+            chan_to_pair[f"order_book_{s}_diff"] = (p, True)
+        # book sides per pair (FULL_BOOK only): {"PAIR": SortedDict{price: size}}
+        bids_by_pair: Dict[str, SortedDict] = {p: SortedDict() for p in batch} if self.FULL_BOOK else {}
+        asks_by_pair: Dict[str, SortedDict] = {p: SortedDict() for p in batch} if self.FULL_BOOK else {}
+        # last emitted top-of-book per pair: ((bid, size) | None, (ask, size) | None), ts_ms
+        last_top: Dict[str, Tuple[Tuple, int]] = {}
+
+        # build all subscribe frames (snapshot, plus diff per symbol when keeping a full book)
         subs = []
         for s in symbols:
             subs.append({"event": "bts:subscribe", "data": {"channel": f"order_book_{s}"}})
-            subs.append({"event": "bts:subscribe", "data": {"channel": f"order_book_{s}_diff"}})
+            if self.FULL_BOOK:
+                subs.append({"event": "bts:subscribe", "data": {"channel": f"order_book_{s}_diff"}})
+        sub_frames = [dumps(m) for m in subs]  # encoded once, reused on reconnect
 
         while True:
             try:
@@ -99,84 +125,86 @@ class BitstampMarket:
                     ping_interval=self.PING_INTERVAL,
                     ping_timeout=self.PING_TIMEOUT,
                     max_size=self.MAX_SIZE,
+                    compression=None,
                 ) as ws:
-                    for msg in subs:
-                        await ws.send(json.dumps(msg))
+                    await asyncio.gather(*(ws.send(f, text=True) for f in sub_frames))
                     # print(f"[bitstamp][ws] subscribed {len(symbols)} symbols (snap+diff)")
 
-                    async for raw in ws:
+                    while True:
+                        # raw frame bytes go straight to the parser: no UTF-8 decode to str first
                         try:
-                            data = json.loads(raw)
+                            raw = await ws.recv(decode=False)
+                        except websockets.ConnectionClosedOK:
+                            break
+                        try:
+                            data = loads(raw)
                         except Exception:
                             continue
 
+                        # book pushes first; everything else is acks, heartbeats or errors
                         ev = data.get("event")
-                        if ev in ("bts:subscription_succeeded", "bts:request_reconnect", "bts:heartbeat"):
-                            continue
-                        if ev in ("bts:error", "error"):
-                            print("[bitstamp][ws][error]:", data); continue
                         if ev != "data":
+                            if ev in ("bts:error", "error"):
+                                print("[bitstamp][ws][error]:", data)
                             continue
 
-                        ch = (data.get("channel") or "").lower()
+                        # ch example: "order_book_btcusd" or "..._diff"
+                        hit = chan_to_pair.get(data.get("channel"))
+                        if not hit:
+                            continue
+                        pair, is_diff = hit
                         payload = data.get("data") or {}
                         bids = payload.get("bids") or []
                         asks = payload.get("asks") or []
 
-                        # ch example: "order_book_btcusd" or "..._diff"
-                        is_diff = ch.endswith("_diff")
-                        base_sym = ch.replace("order_book_", "").replace("_diff", "")
-                        pair = next((p for p in batch if _sym_bs(p) == base_sym), None)
-                        if not pair:
-                            continue
-                        book = books[pair]
-
-                        if not is_diff:
-                            # full snapshot
-                            book['bids'].clear(); book['asks'].clear()
-                            for pr, sz in bids:
-                                try:
-                                    self._set_level("buy", book, float(pr), float(sz))
-                                except:
-                                    pass
-                            for pr, sz in asks:
-                                try:
-                                    self._set_level("sell", book, float(pr), float(sz))
-                                except:
-                                    pass
+                        if not self.FULL_BOOK:
+                            # snapshots arrive sorted best-first: the head of each side is the top
+                            if is_diff:
+                                continue
+                            try:
+                                bb = (float(bids[0][0]), float(bids[0][1])) if bids else None
+                                aa = (float(asks[0][0]), float(asks[0][1])) if asks else None
+                            except (TypeError, ValueError, IndexError):
+                                continue
                         else:
-                            # incremental updates; 0-size => remove level
-                            for pr, sz in bids:
-                                try:
-                                    price = float(pr); size = float(sz)
-                                except:
-                                    continue
-                                self._set_level("buy", book, price, size)
-                            for pr, sz in asks:
-                                try:
-                                    price = float(pr); size = float(sz)
-                                except:
-                                    continue
-                                self._set_level("sell", book, price, size)
-
-                        # derive top-of-book and emit
-                        bb, aa = self._best_levels(book)
+                            book_bids = bids_by_pair[pair]; book_asks = asks_by_pair[pair]
+
+                            if not is_diff:
+                                # full snapshot
+                                book_bids.clear(); book_asks.clear()
+                            # levels are [price_str, size_str]; diffs use 0-size => remove level.
+                            # One guard per frame, not per level
+                            try:
+                                self._apply_levels(book_bids, bids)
+                                self._apply_levels(book_asks, asks)
+                            except (TypeError, ValueError):
+                                continue
+
+                            bb, aa = self._best_levels(book_bids, book_asks)
+
+                        # emit top-of-book
                         if not (bb or aa):
                             continue
+                        # skip the emit when only deeper levels moved
+                        ts = now_ms()
+                        prev = last_top.get(pair)
+                        if prev is not None and prev[0] == (bb, aa) and ts - prev[1] < self.QUOTE_REFRESH_MS:
+                            continue
+                        last_top[pair] = ((bb, aa), ts)
 
                         bid_px = bb[0] if bb else None
                         bid_sz = bb[1] if bb else None
                         ask_px = aa[0] if aa else None
                         ask_sz = aa[1] if aa else None
 
-                        bid_str = f"{bid_px:.12f}" if bid_px is not None else None
-                        ask_str = f"{ask_px:.12f}" if ask_px is not None else None
+                        bid_str = repr(bid_px) if bid_px is not None else None
+                        ask_str = repr(ask_px) if ask_px is not None else None
 
                         q = _QuoteCompat(
                             bid=bid_px, ask=ask_px,
                             bid_sz=bid_sz, ask_sz=ask_sz,
                             bid_str=bid_str, ask_str=ask_str,
-                            ts_ms=now_ms(),
+                            ts_ms=ts,
                         )
                         if self.on_quote:
                             self.on_quote(pair, q)
@@ -189,7 +217,8 @@ class BitstampMarket:
     async def run(self, pairs: List[str]) -> None:
         if not pairs:
             return
-        batches = chunked(sorted(pairs), self.SUB_BATCH)
+        # order by a stable hash instead of alphabetically, so busy pairs spread across sockets
+        batches = chunked(sorted(pairs, key=lambda p: zlib.crc32(p.encode())), self.SUB_BATCH)
         await asyncio.gather(*(self._consume(b) for b in batches))
 
 # Entry point factory for main.py
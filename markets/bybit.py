@@ -1,6 +1,15 @@
 # markets/bybit.py
 import asyncio, aiohttp, websockets, json, time
 from typing import List, Set, Dict, Optional, Callable, Tuple
+from sortedcontainers import SortedDict
+
+try:
+    import orjson
+    loads, dumps = orjson.loads, orjson.dumps
+except ImportError:  # stdlib fallback
+    loads = json.loads
+    def dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
 
 # ---------- Quote-compatible object (same fields main expects) ----------
 class _QuoteCompat:
@@ -12,7 +21,7 @@ class _QuoteCompat:
         self.ts_ms = ts_ms
 
 def now_ms() -> int:
-    return int(time.time() * 1000)
+    return time.time_ns() // 1_000_000
 
 def chunked(seq, n):
     return [seq[i:i+n] for i in range(0, len(seq), n)]
@@ -24,26 +33,43 @@ def _sym_bb(pair: str) -> str:
 class BybitMarket:
     name = "bybit"
     on_quote: Optional[Callable[[str, _QuoteCompat], None]] = None
+    http: Optional[aiohttp.ClientSession] = None  # shared session (set by main)
 
     # Tunables
-    SUB_BATCH = 10                     # topics per socket
+    SUB_BATCH = 200                    # topics per socket
+    SUB_ARGS_MAX = 10                  # spot accepts at most 10 args per subscribe request
+    CONNECT_STAGGER = 0.1              # seconds between socket openings, keeps clear of connect rate limits
     MAX_SIZE = 2**22
     PING_INTERVAL = 20
     PING_TIMEOUT = 20
-    DEPTH = 1                          # allowed: 1, 50, 200, 1000
+    DEPTH = 1                          # allowed: 1, 50, 200, 1000 (1 = top-of-book only, no local book)
     WS_URL = "wss://stream.bybit.com/v5/public/spot"
     REST_INSTR = "https://api.bybit.com/v5/market/instruments-info?category=spot"
+    FLUSH_INTERVAL = 0.02              # seconds between batched on_quote deliveries
+
+    def __init__(self):
+        # newest top per pair since the last flush: (bid, ask, bid_sz, ask_sz, bid_str, ask_str)
+        self._pending: Dict[str, Tuple] = {}
+        # one quote object per pair, updated in place by _flusher
+        self._quotes: Dict[str, _QuoteCompat] = {}
 
     # ---------- Discovery ----------
+    async def _get_json(self, url: str, timeout: int):
+        """GET url through the shared session, or a one-off session if none was given."""
+        if self.http is not None and not self.http.closed:
+            async with self.http.get(url, timeout=timeout) as r:
+                return await r.json()
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url, timeout=timeout) as r:
+                return await r.json()
+
     async def discover(self, desired_pairs: List[str]) -> Set[str]:
         """
         Return subset of desired_pairs supported on Bybit Spot.
         """
         ok: Set[str] = set()
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.REST_INSTR, timeout=20) as r:
-                    j = await r.json()
+            j = await self._get_json(self.REST_INSTR, timeout=20)
             for it in (j.get("result", {}) or {}).get("list", []) or []:
                 base = (it.get("baseCoin") or "").upper()
                 quote = (it.get("quoteCoin") or "").upper()
@@ -57,38 +83,40 @@ class BybitMarket:
 
     # ---------- Helpers ----------
     @staticmethod
-    def _set_level(side: str, book: Dict[str, Dict[str, float]], price: float, size: float):
-        levels = book['bids'] if side == "buy" else book['asks']
-        k = f"{price:.12f}"
-        if size == 0.0:
-            levels.pop(k, None)
-        else:
-            levels[k] = size
+    def _apply_levels(levels: SortedDict, rows) -> None:
+        # rows are [price_str, size_str]; a zero size removes the level.
+        # One call per side keeps the per-level work in a single tight loop.
+        pop = levels.pop
+        for pr, sz in rows:
+            size = float(sz)
+            if size == 0.0:
+                pop(float(pr), None)
+            else:
+                levels[float(pr)] = size
 
     @staticmethod
-    def _best_levels(book: Dict[str, Dict[str, float]]) -> Tuple[Optional[Tuple[float,float]], Optional[Tuple[float,float]]]:
-        bids, asks = book['bids'], book['asks']
-        best_bid = None
-        if bids:
-            pb = max((float(p) for p,s in bids.items() if s > 0.0), default=None)
-            if pb is not None:
-                best_bid = (pb, bids[f"{pb:.12f}"])
-        best_ask = None
-        if asks:
-            pa = min((float(p) for p,s in asks.items() if s > 0.0), default=None)
-            if pa is not None:
-                best_ask = (pa, asks[f"{pa:.12f}"])
-        return best_bid, best_ask
+    def _load_side(rows) -> SortedDict:
+        # a whole snapshot side in one pass; float price keys like _apply_levels, zero sizes dropped
+        return SortedDict((float(pr), size) for pr, sz in rows if (size := float(sz)) > 0.0)
 
     # ---------- Consumer ----------
-    async def _consume(self, batch: List[str]):
-        symbols = [_sym_bb(p) for p in batch]
+    async def _consume(self, batch: List[str], delay: float = 0.0):
+        # symbol -> pair, built once instead of scanning the batch per message
+        sym_to_pair = {_sym_bb(p): p for p in batch}
+        # pooled quote per pair (see _flusher)
+        for p in batch:
+            self._quotes[p] = _QuoteCompat()
+        symbols = list(sym_to_pair)
         args = [f"orderbook.{self.DEPTH}.{s}" for s in symbols]
-        sub_msg = {"op": "subscribe", "args": args}
+        # one subscribe request per SUB_ARGS_MAX topics; encoded once, reused on reconnect
+        sub_frames = [dumps({"op": "subscribe", "args": a}) for a in chunked(args, self.SUB_ARGS_MAX)]
 
-        # per-batch book store: {"PAIR": {"bids": {price_str: size}, "asks": {...}}}
-        books: Dict[str, Dict[str, Dict[str, float]]] = {p: {"bids": {}, "asks": {}} for p in batch}
+        # per-batch book store (DEPTH > 1 only): {"PAIR": {"bids": SortedDict{price: size}, "asks": ...}}
+        top_only = self.DEPTH == 1
+        books: Dict[str, Dict[str, SortedDict]] = {} if top_only else {p: {"bids": SortedDict(), "asks": SortedDict()} for p in batch}
 
+        if delay:
+            await asyncio.sleep(delay)  # staggered first connect
         while True:
             try:
                 async with websockets.connect(
@@ -96,13 +124,27 @@ class BybitMarket:
                     ping_interval=self.PING_INTERVAL,
                     ping_timeout=self.PING_TIMEOUT,
                     max_size=self.MAX_SIZE,
+                    compression=None,
                 ) as ws:
-                    await ws.send(json.dumps(sub_msg))
+                    await asyncio.gather(*(ws.send(f, text=True) for f in sub_frames))
                     # print(f"[bybit][ws] subscribe {len(args)} topics @ depth {self.DEPTH}")
 
-                    async for raw in ws:
+                    n = 0  # frames since the last explicit yield
+                    # hot-loop lookups bound to locals once per connection
+                    resolve = sym_to_pair.get
+                    apply_levels, load_side = self._apply_levels, self._load_side
+                    while True:
+                        # raw frame bytes go straight to the parser: no UTF-8 decode to str first
+                        try:
+                            raw = await ws.recv(decode=False)
+                        except websockets.ConnectionClosedOK:
+                            break
+                        # recv() returns without suspending while frames are buffered; give other sockets a turn during bursts
+                        n += 1
+                        if not n & 0xFF:
+                            await asyncio.sleep(0)
                         try:
-                            data = json.loads(raw)
+                            data = loads(raw)
                         except Exception:
                             continue
 
@@ -114,7 +156,7 @@ class BybitMarket:
                                 print("[bybit][ws][error]:", data)
                             continue
                         if data.get("op") == "ping":
-                            await ws.send(json.dumps({"op": "pong", "req_id": data.get("req_id")}))
+                            await ws.send(dumps({"op": "pong", "req_id": data.get("req_id")}), text=True)
                             continue
 
                         topic = data.get("topic") or ""
@@ -123,48 +165,43 @@ class BybitMarket:
 
                         if not topic or not typ or not payload:
                             continue
-                        try:
-                            _, _, symbol = topic.split(".", 2)  # orderbook.{depth}.{symbol}
-                        except Exception:
-                            continue
-
-                        pair = next((p for p in batch if _sym_bb(p) == symbol), None)
+                        # orderbook.{depth}.{symbol}: the symbol is everything after the last dot
+                        pair = resolve(topic[topic.rfind(".") + 1:])
                         if not pair:
                             continue
-                        book = books[pair]
 
                         bids = payload.get("b") or []
                         asks = payload.get("a") or []
 
-                        if typ == "snapshot":
-                            book['bids'].clear(); book['asks'].clear()
-                            for pr, sz in bids:
-                                try:
-                                    self._set_level("buy", book, float(pr), float(sz))
-                                except:
-                                    pass
-                            for pr, sz in asks:
-                                try:
-                                    self._set_level("sell", book, float(pr), float(sz))
-                                except:
-                                    pass
-                        elif typ == "delta":
-                            for pr, sz in bids:
+                        if top_only:
+                            # orderbook.1 pushes just the best level per side: read it directly
+                            try:
+                                bb = (float(bids[0][0]), float(bids[0][1])) if bids else None
+                                aa = (float(asks[0][0]), float(asks[0][1])) if asks else None
+                            except (TypeError, ValueError, IndexError):
+                                continue
+                        else:
+                            book = books[pair]
+
+                            if typ == "snapshot":
                                 try:
-                                    price = float(pr); size = float(sz)
-                                except:
+                                    new_bids = load_side(bids); new_asks = load_side(asks)
+                                except (TypeError, ValueError):
                                     continue
-                                self._set_level("buy", book, price, size)
-                            for pr, sz in asks:
+                                book['bids'], book['asks'] = new_bids, new_asks
+                            elif typ == "delta":
                                 try:
-                                    price = float(pr); size = float(sz)
-                                except:
+                                    apply_levels(book['bids'], bids)
+                                    apply_levels(book['asks'], asks)
+                                except (TypeError, ValueError):
                                     continue
-                                self._set_level("sell", book, price, size)
-                        else:
-                            continue
+                            else:
+                                continue
 
-                        bb, aa = self._best_levels(book)
+                            # best levels straight off the SortedDicts; zero sizes are never stored
+                            book_bids, book_asks = book['bids'], book['asks']
+                            bb = book_bids.peekitem(-1) if book_bids else None
+                            aa = book_asks.peekitem(0) if book_asks else None
                         if not (bb or aa):
                             continue
 
@@ -173,28 +210,40 @@ class BybitMarket:
                         ask_px = aa[0] if aa else None
                         ask_sz = aa[1] if aa else None
 
-                        bid_str = f"{bid_px:.12f}" if bid_px is not None else None
-                        ask_str = f"{ask_px:.12f}" if ask_px is not None else None
+                        bid_str = repr(bid_px) if bid_px is not None else None
+                        ask_str = repr(ask_px) if ask_px is not None else None
 
-                        q = _QuoteCompat(
-                            bid=bid_px, ask=ask_px,
-                            bid_sz=bid_sz, ask_sz=ask_sz,
-                            bid_str=bid_str, ask_str=ask_str,
-                            ts_ms=now_ms(),
-                        )
-                        if self.on_quote:
-                            self.on_quote(pair, q)
+                        # bursts collapse to the newest top per pair; _flusher delivers it
+                        self._pending[pair] = (bid_px, ask_px, bid_sz, ask_sz, bid_str, ask_str)
 
             except Exception as e:
                 print("[bybit] reconnecting after error:", e)
                 await asyncio.sleep(3)
 
+    async def _flusher(self):
+        """Deliver the newest top per pair once per FLUSH_INTERVAL."""
+        quotes = self._quotes
+        while True:
+            await asyncio.sleep(self.FLUSH_INTERVAL)
+            if not self._pending or not self.on_quote:
+                continue
+            pending, self._pending = self._pending, {}
+            on_quote = self.on_quote
+            ts = now_ms()  # one clock read per flush, not per frame
+            for pair, (bid, ask, bid_sz, ask_sz, bid_str, ask_str) in pending.items():
+                q = quotes[pair]  # reused per pair; main only keeps the latest quote
+                q.bid, q.ask = bid, ask
+                q.bid_sz, q.ask_sz = bid_sz, ask_sz
+                q.bid_str, q.ask_str = bid_str, ask_str
+                q.ts_ms = ts
+                on_quote(pair, q)
+
     # ---------- Runner ----------
     async def run(self, pairs: List[str]) -> None:
         if not pairs:
             return
         batches = chunked(sorted(pairs), self.SUB_BATCH)
-        await asyncio.gather(*(self._consume(b) for b in batches))
+        await asyncio.gather(self._flusher(), *(self._consume(b, i * self.CONNECT_STAGGER) for i, b in enumerate(batches)))
 
 # Entry point factory for main.py
 def MARKET_CLASS():
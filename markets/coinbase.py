@@ -1,6 +1,15 @@
 # markets/coinbase.py
 import asyncio, aiohttp, websockets, json, time
 from typing import List, Set, Dict, Optional, Callable, Tuple
+from sortedcontainers import SortedDict
+
+try:
+    import orjson
+    loads, dumps = orjson.loads, orjson.dumps
+except ImportError:  # stdlib fallback
+    loads = json.loads
+    def dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
 
 # ---------- Quote-compatible object (same fields main expects) ----------
 class _QuoteCompat:
@@ -12,7 +21,7 @@ class _QuoteCompat:
         self.ts_ms = ts_ms
 
 def now_ms() -> int:
-    return int(time.time() * 1000)
+    return time.time_ns() // 1_000_000
 
 def chunked(seq, n):
     return [seq[i:i+n] for i in range(0, len(seq), n)]
@@ -24,26 +33,42 @@ def _sym_cb(pair: str) -> str:
 class CoinbaseMarket:
     name = "coinbase"
     on_quote: Optional[Callable[[str, _QuoteCompat], None]] = None
+    http: Optional[aiohttp.ClientSession] = None  # shared session (set by main)
 
     # Tunables
     SUB_BATCH = 60
     MAX_SIZE = 2**22
     PING_INTERVAL = 20
     PING_TIMEOUT = 20
-    USE_L2_BATCH = True  # set True to reduce message rate (~5s cadence)
+    FULL_BOOK = True     # True: level2 book; False: "ticker" channel (opt-in: pushes on trades only, so BBO goes stale on thin pairs)
+    USE_L2_BATCH = True  # FULL_BOOK only: set True to reduce message rate (~5s cadence)
     REST_PRODUCTS = "https://api.exchange.coinbase.com/products"
     WS_URL = "wss://ws-feed.exchange.coinbase.com"
+    FLUSH_INTERVAL = 0.02  # seconds between batched on_quote deliveries
+
+    def __init__(self):
+        # newest top per pair since the last flush: (bid, ask, bid_sz, ask_sz, bid_str, ask_str)
+        self._pending: Dict[str, Tuple] = {}
+        # one quote object per pair, updated in place by _flusher
+        self._quotes: Dict[str, _QuoteCompat] = {}
 
     # ---------- Discovery ----------
+    async def _get_json(self, url: str, timeout: int):
+        """GET url through the shared session, or a one-off session if none was given."""
+        if self.http is not None and not self.http.closed:
+            async with self.http.get(url, timeout=timeout) as r:
+                return await r.json()
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url, timeout=timeout) as r:
+                return await r.json()
+
     async def discover(self, desired_pairs: List[str]) -> Set[str]:
         """
         Return subset of desired_pairs supported on Coinbase (advanced trade), filtering to online & tradable.
         """
         ok: Set[str] = set()
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.REST_PRODUCTS, timeout=20) as r:
-                    j = await r.json()
+            j = await self._get_json(self.REST_PRODUCTS, timeout=20)
             for prod in j if isinstance(j, list) else []:
                 base = (prod.get("base_currency") or "").upper()
                 quote = (prod.get("quote_currency") or "").upper()
@@ -60,36 +85,37 @@ class CoinbaseMarket:
 
     # ---------- Helpers ----------
     @staticmethod
-    def _set_level(side: str, book: Dict[str, Dict[str, float]], price: float, size: float):
-        levels = book['bids'] if side == "buy" else book['asks']
-        k = f"{price:.12f}"
-        if size == 0.0:
-            levels.pop(k, None)
-        else:
-            levels[k] = size
+    def _apply_changes(bids: SortedDict, asks: SortedDict, changes) -> None:
+        # l2update rows are [side, price_str, size_str]; a zero size removes the level.
+        # One call per frame keeps the per-level work in a single tight loop.
+        for side, pr, sz in changes:
+            levels = bids if side.lower() == "buy" else asks
+            size = float(sz)
+            if size == 0.0:
+                levels.pop(float(pr), None)
+            else:
+                levels[float(pr)] = size
 
     @staticmethod
-    def _best_levels(book: Dict[str, Dict[str, float]]) -> Tuple[Optional[Tuple[float,float]], Optional[Tuple[float,float]]]:
-        bids = book['bids']; asks = book['asks']
-        best_bid = None
-        if bids:
-            pb = max((float(p) for p,s in bids.items() if s > 0.0), default=None)
-            if pb is not None:
-                best_bid = (pb, bids[f"{pb:.12f}"])
-        best_ask = None
-        if asks:
-            pa = min((float(p) for p,s in asks.items() if s > 0.0), default=None)
-            if pa is not None:
-                best_ask = (pa, asks[f"{pa:.12f}"])
-        return best_bid, best_ask
+    def _load_side(rows) -> SortedDict:
+        # a whole snapshot side in one pass; float price keys like _apply_changes, zero sizes dropped
+        return SortedDict((float(pr), size) for pr, sz in rows if (size := float(sz)) > 0.0)
 
     # ---------- Consumer ----------
     async def _consume(self, batch: List[str]):
-        # per-batch order books: books[pair] = {"bids": {price_str: size}, "asks": {...}}
-        books: Dict[str, Dict[str, Dict[str, float]]] = {p: {"bids": {}, "asks": {}} for p in batch}
-        product_ids = [_sym_cb(p) for p in batch]
-        channel_name = "level2_batch" if self.USE_L2_BATCH else "level2"
-        sub_msg = {"type": "subscribe", "channels": [{"name": channel_name, "product_ids": product_ids}]}
+        # per-batch order books (FULL_BOOK only): books[pair] = {"bids": SortedDict{price: size}, "asks": ...}
+        books: Dict[str, Dict[str, SortedDict]] = {p: {"bids": SortedDict(), "asks": SortedDict()} for p in batch} if self.FULL_BOOK else {}
+        # product id -> pair, built once instead of scanning the batch per message
+        pid_to_pair = {_sym_cb(p): p for p in batch}
+        # pooled quote per pair (see _flusher)
+        for p in batch:
+            self._quotes[p] = _QuoteCompat()
+        product_ids = list(pid_to_pair)
+        if self.FULL_BOOK:
+            channel_name = "level2_batch" if self.USE_L2_BATCH else "level2"
+        else:
+            channel_name = "ticker"
+        sub_frame = dumps({"type": "subscribe", "channels": [{"name": channel_name, "product_ids": product_ids}]})  # encoded once, reused on reconnect
 
         while True:
             try:
@@ -98,13 +124,27 @@ class CoinbaseMarket:
                     ping_interval=self.PING_INTERVAL,
                     ping_timeout=self.PING_TIMEOUT,
                     max_size=self.MAX_SIZE,
+                    compression=None,
                 ) as ws:
-                    await ws.send(json.dumps(sub_msg))
+                    await ws.send(sub_frame, text=True)
                     # print(f"[coinbase][ws] subscribed {len(product_ids)} to {channel_name}")
 
-                    async for raw in ws:
+                    n = 0  # frames since the last explicit yield
+                    # hot-loop lookups bound to locals once per connection
+                    resolve = pid_to_pair.get
+                    apply_changes, load_side = self._apply_changes, self._load_side
+                    while True:
+                        # raw frame bytes go straight to the parser: no UTF-8 decode to str first
+                        try:
+                            raw = await ws.recv(decode=False)
+                        except websockets.ConnectionClosedOK:
+                            break
+                        # recv() returns without suspending while frames are buffered; give other sockets a turn during bursts
+                        n += 1
+                        if not n & 0xFF:
+                            await asyncio.sleep(0)
                         try:
-                            data = json.loads(raw)
+                            data = loads(raw)
                         except Exception:
                             continue
 
@@ -113,69 +153,96 @@ class CoinbaseMarket:
                             if t == "error":
                                 print("[coinbase][ws][error]:", data)
                             continue
-                        if t not in ("snapshot", "l2update"):
+                        if t not in ("ticker", "snapshot", "l2update"):
                             continue
 
                         pid = data.get("product_id") or ""
-                        pair = next((p for p in batch if _sym_cb(p) == pid), None)
+                        pair = resolve(pid)
                         if not pair:
                             continue
-                        book = books[pair]
+
+                        if t == "ticker":
+                            # best bid/ask come with every ticker push; keep the raw strings
+                            bid_str = data.get("best_bid"); ask_str = data.get("best_ask")
+                            try:
+                                bid_px = float(bid_str) if bid_str else None
+                                ask_px = float(ask_str) if ask_str else None
+                                bid_sz = float(data["best_bid_size"]) if bid_px is not None else None
+                                ask_sz = float(data["best_ask_size"]) if ask_px is not None else None
+                            except (KeyError, TypeError, ValueError):
+                                continue
+                            if bid_px is None and ask_px is None:
+                                continue
+                            # bursts collapse to the newest top per pair; _flusher delivers it
+                            self._pending[pair] = (
+                                bid_px, ask_px, bid_sz, ask_sz,
+                                bid_str if bid_px is not None else None,
+                                ask_str if ask_px is not None else None,
+                            )
+                            continue
+
+                        book = books.get(pair)
+                        if book is None:
+                            continue
 
                         if t == "snapshot":
                             # reset and load full levels
-                            book['bids'].clear(); book['asks'].clear()
-                            for pr, sz in data.get("bids", []):
-                                try:
-                                    price = float(pr); size = float(sz)
-                                    self._set_level("buy", book, price, size)
-                                except:
-                                    pass
-                            for pr, sz in data.get("asks", []):
-                                try:
-                                    price = float(pr); size = float(sz)
-                                    self._set_level("sell", book, price, size)
-                                except:
-                                    pass
+                            try:
+                                new_bids = load_side(data.get("bids", []))
+                                new_asks = load_side(data.get("asks", []))
+                            except (TypeError, ValueError):
+                                continue
+                            book['bids'], book['asks'] = new_bids, new_asks
 
                         elif t == "l2update":
-                            for side, pr, sz in data.get("changes", []):
-                                side = side.lower()
-                                try:
-                                    price = float(pr); size = float(sz)
-                                except:
-                                    continue
-                                self._set_level("buy" if side == "buy" else "sell", book, price, size)
-
-                        bb, aa = self._best_levels(book)
+                            try:
+                                apply_changes(book['bids'], book['asks'], data.get("changes", []))
+                            except (AttributeError, TypeError, ValueError):
+                                continue
+
+                        # best levels straight off the SortedDicts; zero sizes are never stored
+                        book_bids, book_asks = book['bids'], book['asks']
+                        bb = book_bids.peekitem(-1) if book_bids else None
+                        aa = book_asks.peekitem(0) if book_asks else None
                         if bb or aa:
                             bid_px = bb[0] if bb else None
                             bid_sz = bb[1] if bb else None
                             ask_px = aa[0] if aa else None
                             ask_sz = aa[1] if aa else None
 
-                            bid_str = f"{bid_px:.12f}" if bid_px is not None else None
-                            ask_str = f"{ask_px:.12f}" if ask_px is not None else None
+                            bid_str = repr(bid_px) if bid_px is not None else None
+                            ask_str = repr(ask_px) if ask_px is not None else None
 
-                            q = _QuoteCompat(
-                                bid=bid_px, ask=ask_px,
-                                bid_sz=bid_sz, ask_sz=ask_sz,
-                                bid_str=bid_str, ask_str=ask_str,
-                                ts_ms=now_ms(),
-                            )
-                            if self.on_quote:
-                                self.on_quote(pair, q)
+                            self._pending[pair] = (bid_px, ask_px, bid_sz, ask_sz, bid_str, ask_str)
 
             except Exception as e:
                 print("[coinbase] reconnecting after error:", e)
                 await asyncio.sleep(3)
 
+    async def _flusher(self):
+        """Deliver the newest top per pair once per FLUSH_INTERVAL."""
+        quotes = self._quotes
+        while True:
+            await asyncio.sleep(self.FLUSH_INTERVAL)
+            if not self._pending or not self.on_quote:
+                continue
+            pending, self._pending = self._pending, {}
+            on_quote = self.on_quote
+            ts = now_ms()  # one clock read per flush, not per frame
+            for pair, (bid, ask, bid_sz, ask_sz, bid_str, ask_str) in pending.items():
+                q = quotes[pair]  # reused per pair; main only keeps the latest quote
+                q.bid, q.ask = bid, ask
+                q.bid_sz, q.ask_sz = bid_sz, ask_sz
+                q.bid_str, q.ask_str = bid_str, ask_str
+                q.ts_ms = ts
+                on_quote(pair, q)
+
     # ---------- Runner ----------
     async def run(self, pairs: List[str]) -> None:
         if not pairs:
             return
         batches = chunked(sorted(pairs), self.SUB_BATCH)
-        await asyncio.gather(*(self._consume(b) for b in batches))
+        await asyncio.gather(self._flusher(), *(self._consume(b) for b in batches))
 
 # Entry point factory for main.py
 def MARKET_CLASS():
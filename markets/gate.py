@@ -2,6 +2,14 @@
 import asyncio, aiohttp, websockets, json, time
 from typing import List, Set, Dict, Optional, Callable, Tuple
 
+try:
+    import orjson
+    loads, dumps = orjson.loads, orjson.dumps
+except ImportError:  # stdlib fallback
+    loads = json.loads
+    def dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
+
 # ---- Quote-compatible object (same fields main expects) ----
 class _QuoteCompat:
     __slots__ = ("bid","ask","bid_sz","ask_sz","bid_str","ask_str","ts_ms")
@@ -12,7 +20,7 @@ class _QuoteCompat:
         self.ts_ms = ts_ms
 
 def now_ms() -> int:
-    return int(time.time() * 1000)
+    return time.time_ns() // 1_000_000
 
 def chunked(seq, n):
     return [seq[i:i+n] for i in range(0, len(seq), n)]
@@ -24,6 +32,7 @@ def _sym_gate(pair: str) -> str:
 class GateMarket:
     name = "gate"
     on_quote: Optional[Callable[[str, _QuoteCompat], None]] = None
+    http: Optional[aiohttp.ClientSession] = None  # shared session (set by main)
 
     # Tunables
     SUB_BATCH = 60
@@ -35,6 +44,15 @@ class GateMarket:
     GATE_INTERVAL = "100ms"  # 100ms or 1000ms
 
     # ========= Discovery =========
+    async def _get_json(self, url: str, timeout: int):
+        """GET url through the shared session, or a one-off session if none was given."""
+        if self.http is not None and not self.http.closed:
+            async with self.http.get(url, timeout=timeout) as r:
+                return await r.json()
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url, timeout=timeout) as r:
+                return await r.json()
+
     async def discover(self, desired_pairs: List[str]) -> Set[str]:
         """
         Return subset of desired_pairs that are tradable on Gate.io spot.
@@ -42,9 +60,7 @@ class GateMarket:
         url = "https://api.gateio.ws/api/v4/spot/currency_pairs"
         ok: Set[str] = set()
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=20) as r:
-                    j = await r.json()
+            j = await self._get_json(url, timeout=20)
             if not isinstance(j, list):
                 return ok
             # Map "ETH_USDT" -> "tradable"/"untradable"
@@ -60,15 +76,21 @@ class GateMarket:
 
     # ========= Consumer =========
     async def _consume(self, batch_pairs: List[str]):
-        subs = [
-            {
-                "time": int(time.time()),
+        # gate id -> pair, built once instead of scanning the batch per message
+        sym_to_pair = {_sym_gate(p): p for p in batch_pairs}
+        # one quote object per pair, updated in place on every emit
+        quotes: Dict[str, _QuoteCompat] = {p: _QuoteCompat() for p in batch_pairs}
+        # subscribe frames are encoded once minus the leading "{"; each connect splices in a fresh
+        # "time" (Gate rejects requests more than 60s off server time). Encoded bytes go out with text=True
+        sub_tails = [
+            dumps({
                 "channel": "spot.order_book",
                 "event": "subscribe",
-                "payload": [_sym_gate(p), self.GATE_LEVELS, self.GATE_INTERVAL],
-            }
-            for p in batch_pairs
+                "payload": [gid, self.GATE_LEVELS, self.GATE_INTERVAL],
+            })
+            for gid in sym_to_pair
         ]
+        sub_tails = [t[1:] for t in sub_tails]
 
         while True:
             try:
@@ -79,13 +101,25 @@ class GateMarket:
                     max_size=self.MAX_SIZE,
                     compression=None,
                 ) as ws:
-                    # send subs
-                    for sub in subs:
-                        await ws.send(json.dumps(sub))
-
-                    async for raw in ws:
+                    # send subs (spot.order_book takes one pair per frame); out together, not one await each
+                    t = int(time.time())
+                    await asyncio.gather(*(ws.send(b'{"time":%d,%s' % (t, tail), text=True) for tail in sub_tails))
+
+                    on_quote = self.on_quote  # bound once per connection, not per frame
+                    n = 0  # frames since the last explicit yield
+                    resolve = sym_to_pair.get  # bound once per connection
+                    while True:
+                        # raw frame bytes go straight to the parser: no UTF-8 decode to str first
+                        try:
+                            raw = await ws.recv(decode=False)
+                        except websockets.ConnectionClosedOK:
+                            break
+                        # recv() returns without suspending while frames are buffered; give other sockets a turn during bursts
+                        n += 1
+                        if not n & 0xFF:
+                            await asyncio.sleep(0)
                         try:
-                            data = json.loads(raw)
+                            data = loads(raw)
                         except Exception:
                             continue
 
@@ -97,7 +131,7 @@ class GateMarket:
 
                         res = data.get("result") or {}
                         sym = res.get("s") or ""
-                        pair = next((p for p in batch_pairs if _sym_gate(p) == sym), None)
+                        pair = resolve(sym)
                         if not pair:
                             continue
 
@@ -109,13 +143,13 @@ class GateMarket:
                         bid_px_str = bid_sz_str = ask_px_str = ask_sz_str = None
 
                         if bids and bids[0]:
-                            bid_px_str, bid_sz_str = str(bids[0][0]), str(bids[0][1])
+                            bid_px_str, bid_sz_str = bids[0][0], bids[0][1]  # already strings in the payload
                             try:
                                 bid_px = float(bid_px_str); bid_sz = float(bid_sz_str)
                             except:
                                 bid_px = bid_sz = None
                         if asks and asks[0]:
-                            ask_px_str, ask_sz_str = str(asks[0][0]), str(asks[0][1])
+                            ask_px_str, ask_sz_str = asks[0][0], asks[0][1]
                             try:
                                 ask_px = float(ask_px_str); ask_sz = float(ask_sz_str)
                             except:
@@ -124,14 +158,13 @@ class GateMarket:
                         if bid_px is None and ask_px is None:
                             continue
 
-                        q = _QuoteCompat(
-                            bid=bid_px, ask=ask_px,
-                            bid_sz=bid_sz, ask_sz=ask_sz,
-                            bid_str=bid_px_str, ask_str=ask_px_str,
-                            ts_ms=now_ms()
-                        )
-                        if self.on_quote:
-                            self.on_quote(pair, q)
+                        q = quotes[pair]  # reused per pair; main only keeps the latest quote
+                        q.bid, q.ask = bid_px, ask_px
+                        q.bid_sz, q.ask_sz = bid_sz, ask_sz
+                        q.bid_str, q.ask_str = bid_px_str, ask_px_str
+                        q.ts_ms = now_ms()
+                        if on_quote:
+                            on_quote(pair, q)
 
             except Exception as e:
                 print("[gate] reconnecting after error:", e)
@@ -1,7 +1,22 @@
 # markets/htx.py
-import asyncio, aiohttp, websockets, json, time, gzip
+import asyncio, aiohttp, websockets, json, time, zlib
 from typing import List, Set, Dict, Optional, Callable, Tuple
 
+try:
+    import orjson
+    loads, dumps = orjson.loads, orjson.dumps
+except ImportError:  # stdlib fallback
+    loads = json.loads
+    def dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
+
+try:
+    from isal.igzip import decompress as _gunzip  # SIMD inflate when isal is installed
+except ImportError:
+    def _gunzip(data: bytes) -> bytes:
+        # wbits=31: gzip container, inflated in one call without a GzipFile wrapper
+        return zlib.decompress(data, 31)
+
 # Quote-compatible object (same attributes main expects)
 class _QuoteCompat:
     __slots__ = ("bid","ask","bid_sz","ask_sz","bid_str","ask_str","ts_ms")
@@ -12,7 +27,7 @@ class _QuoteCompat:
         self.ts_ms = ts_ms
 
 def now_ms() -> int:
-    return int(time.time() * 1000)
+    return time.time_ns() // 1_000_000
 
 def chunked(seq, n):
     return [seq[i:i+n] for i in range(0, len(seq), n)]
@@ -24,6 +39,7 @@ def _sym_htx(pair: str) -> str:
 class HtxMarket:
     name = "htx"
     on_quote: Optional[Callable[[str, _QuoteCompat], None]] = None
+    http: Optional[aiohttp.ClientSession] = None  # shared session (set by main)
 
     # Tunables
     SUB_BATCH = 61
@@ -32,6 +48,15 @@ class HtxMarket:
     PING_TIMEOUT = 20
 
     # ========= Discovery =========
+    async def _get_json(self, url: str, timeout: int):
+        """GET url through the shared session, or a one-off session if none was given."""
+        if self.http is not None and not self.http.closed:
+            async with self.http.get(url, timeout=timeout) as r:
+                return await r.json()
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url, timeout=timeout) as r:
+                return await r.json()
+
     async def discover(self, desired_pairs: List[str]) -> Set[str]:
         """
         Return subset of desired_pairs that are online tradable on HTX (Huobi spot).
@@ -39,9 +64,7 @@ class HtxMarket:
         url = "https://api.huobi.pro/v1/common/symbols"
         ok: Set[str] = set()
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=20) as r:
-                    j = await r.json()
+            j = await self._get_json(url, timeout=20)
             for it in j.get("data", []) or []:
                 if (it.get("state") or "").lower() != "online":
                     continue
@@ -57,40 +80,48 @@ class HtxMarket:
     # ========= Consumer =========
     async def _consume(self, batch: List[str]):
         url = "wss://api.huobi.pro/ws"
-        # build subscriptions
-        subs = [{"sub": f"market.{_sym_htx(p)}.depth.step0", "id": f"sub-{_sym_htx(p)}"} for p in batch]
+        # symbol -> pair, built once instead of scanning the batch per message
+        sym_to_pair = {_sym_htx(p): p for p in batch}
+        # one quote object per pair, updated in place on every emit
+        quotes: Dict[str, _QuoteCompat] = {p: _QuoteCompat() for p in batch}
+        # subscribe frames are encoded once and reused on reconnect; encoded bytes go out with text=True
+        sub_frames = [dumps({"sub": f"market.{s}.depth.step0", "id": f"sub-{s}"}) for s in sym_to_pair]
 
         while True:
             try:
                 async with websockets.connect(
-                    url, ping_interval=self.PING_INTERVAL, ping_timeout=self.PING_TIMEOUT, max_size=self.MAX_SIZE
+                    url, ping_interval=self.PING_INTERVAL, ping_timeout=self.PING_TIMEOUT, max_size=self.MAX_SIZE,
+                    compression=None,
                 ) as ws:
-                    # subscribe all channels in this batch
-                    for msg in subs:
-                        await ws.send(json.dumps(msg))
+                    # subscribe all channels in this batch; frames go out together instead of one await each
+                    await asyncio.gather(*(ws.send(f, text=True) for f in sub_frames))
 
+                    on_quote = self.on_quote  # bound once per connection, not per frame
+                    n = 0  # frames since the last explicit yield
+                    resolve = sym_to_pair.get  # bound once per connection
                     async for raw in ws:
-                        # frames are often gzip-compressed bytes
+                        # the iterator returns without suspending while frames are buffered; give other sockets a turn during bursts
+                        n += 1
+                        if not n & 0xFF:
+                            await asyncio.sleep(0)
+                        # frames are often gzip-compressed bytes; the parser takes bytes as-is
                         if isinstance(raw, (bytes, bytearray)):
                             try:
-                                txt = gzip.decompress(raw).decode()
+                                txt = _gunzip(raw)
                             except Exception:
-                                try:
-                                    txt = raw.decode()
-                                except Exception:
-                                    continue
+                                txt = raw
                         else:
                             txt = raw
 
                         try:
-                            data = json.loads(txt)
+                            data = loads(txt)
                         except Exception:
                             continue
 
                         # ping/pong
                         if "ping" in data:
                             try:
-                                await ws.send(json.dumps({"pong": data["ping"]}))
+                                await ws.send(dumps({"pong": data["ping"]}), text=True)
                             except:
                                 pass
                             continue
@@ -108,48 +139,48 @@ class HtxMarket:
                         if not ch or not tick:
                             continue
 
-                        # channel looks like: market.btcusdt.depth.step0
+                        # channel looks like: market.btcusdt.depth.step0; slice out the symbol, no split list
                         try:
-                            sym = ch.split(".")[1]
-                        except Exception:
+                            sym = ch[7:ch.index(".", 7)]
+                        except ValueError:
                             continue
 
                         # map back to pair in this batch
-                        pair = next((p for p in batch if _sym_htx(p) == sym), None)
+                        pair = resolve(sym)
                         if not pair:
                             continue
 
                         bids = tick.get("bids") or []
                         asks = tick.get("asks") or []
 
-                        # take top-of-book; HTX step0 snapshot is sorted (bids desc, asks asc)
+                        # take top-of-book; HTX step0 snapshot is sorted (bids desc, asks asc).
+                        # Levels arrive as JSON numbers: float() them directly, stringify only the price.
                         bid_px = bid_sz = ask_px = ask_sz = None
-                        bid_px_str = bid_sz_str = ask_px_str = ask_sz_str = None
+                        bid_px_str = ask_px_str = None
 
                         if bids and bids[0]:
-                            bid_px_str = str(bids[0][0]); bid_sz_str = str(bids[0][1])
                             try:
-                                bid_px = float(bid_px_str); bid_sz = float(bid_sz_str)
+                                bid_px = float(bids[0][0]); bid_sz = float(bids[0][1])
+                                bid_px_str = str(bids[0][0])
                             except:
                                 bid_px = bid_sz = None
                         if asks and asks[0]:
-                            ask_px_str = str(asks[0][0]); ask_sz_str = str(asks[0][1])
                             try:
-                                ask_px = float(ask_px_str); ask_sz = float(ask_sz_str)
+                                ask_px = float(asks[0][0]); ask_sz = float(asks[0][1])
+                                ask_px_str = str(asks[0][0])
                             except:
                                 ask_px = ask_sz = None
 
                         if bid_px is None and ask_px is None:
                             continue
 
-                        q = _QuoteCompat(
-                            bid=bid_px, ask=ask_px,
-                            bid_sz=bid_sz, ask_sz=ask_sz,
-                            bid_str=bid_px_str, ask_str=ask_px_str,
-                            ts_ms=now_ms()
-                        )
-                        if self.on_quote:
-                            self.on_quote(pair, q)
+                        q = quotes[pair]  # reused per pair; main only keeps the latest quote
+                        q.bid, q.ask = bid_px, ask_px
+                        q.bid_sz, q.ask_sz = bid_sz, ask_sz
+                        q.bid_str, q.ask_str = bid_px_str, ask_px_str
+                        q.ts_ms = now_ms()
+                        if on_quote:
+                            on_quote(pair, q)
 
             except Exception as e:
                 print("[htx] reconnecting after error:", e)
@@ -1,6 +1,15 @@
 # markets/kraken.py
 import asyncio, aiohttp, websockets, json, time
-from typing import List, Set, Dict, Optional, Callable
+from typing import List, Set, Dict, Optional, Callable, Tuple
+from sortedcontainers import SortedDict
+
+try:
+    import orjson
+    loads, dumps = orjson.loads, orjson.dumps
+except ImportError:  # stdlib fallback
+    loads = json.loads
+    def dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
 
 # ---------- Quote-compatible object (same fields main expects) ----------
 class _QuoteCompat:
@@ -12,7 +21,7 @@ class _QuoteCompat:
         self.ts_ms = ts_ms
 
 def now_ms() -> int:
-    return int(time.time() * 1000)
+    return time.time_ns() // 1_000_000
 
 def chunked(seq, n):
     return [seq[i:i+n] for i in range(0, len(seq), n)]
@@ -35,6 +44,7 @@ def _human_to_wsname(pair: str) -> str:
 class KrakenMarket:
     name = "kraken"
     on_quote: Optional[Callable[[str, _QuoteCompat], None]] = None
+    http: Optional[aiohttp.ClientSession] = None  # shared session (set by main)
 
     # Tunables
     SUB_BATCH = 60
@@ -42,10 +52,20 @@ class KrakenMarket:
     PING_INTERVAL = 20
     PING_TIMEOUT = 20
     KRAKEN_BOOK_DEPTH = 10  # can be 10, 25, etc.
+    QUOTE_REFRESH_MS = 5000  # re-emit an unchanged top at least this often so ages stay live
     REST_ASSET_PAIRS = "https://api.kraken.com/0/public/AssetPairs"
     WS_URL = "wss://ws.kraken.com/"
 
     # ---------- Discovery ----------
+    async def _get_json(self, url: str, timeout: int):
+        """GET url through the shared session, or a one-off session if none was given."""
+        if self.http is not None and not self.http.closed:
+            async with self.http.get(url, timeout=timeout) as r:
+                return await r.json()
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url, timeout=timeout) as r:
+                return await r.json()
+
     async def discover(self, desired_pairs: List[str]) -> Set[str]:
         """
         Return subset of desired_pairs supported on Kraken Spot, and cache pair->wsname.
@@ -53,9 +73,7 @@ class KrakenMarket:
         ok: Set[str] = set()
         mapping: Dict[str, str] = {}
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.REST_ASSET_PAIRS, timeout=25) as r:
-                    j = await r.json()
+            j = await self._get_json(self.REST_ASSET_PAIRS, timeout=25)
             result = j.get("result", {}) or {}
             desired = set(desired_pairs)
             for _k, info in result.items():
@@ -72,10 +90,34 @@ class KrakenMarket:
         self._pair_to_wsname = mapping
         return ok
 
+    # ---------- Helpers ----------
+    @staticmethod
+    def _load_side(rows) -> SortedDict:
+        # snapshot levels are [price, volume, timestamp]; float price keys, zero volumes dropped
+        return SortedDict((float(lvl[0]), vol) for lvl in rows if (vol := float(lvl[1])) > 0.0)
+
+    @staticmethod
+    def _apply_levels(levels: SortedDict, rows) -> None:
+        # update levels are [price, volume, timestamp(, "r")]; a zero volume removes the level.
+        # One call per side keeps the per-level work in a single tight loop.
+        pop = levels.pop
+        for lvl in rows:
+            vol = float(lvl[1])
+            if vol <= 0.0:
+                pop(float(lvl[0]), None)
+            else:
+                levels[float(lvl[0])] = vol
+
     # ---------- Consumer ----------
     async def _consume(self, batch: List[str]):
-        # books[pair] = {"bids": {price: volume}, "asks": {price: volume}}
-        books: Dict[str, Dict[str, Dict[float, float]]] = {}
+        # book sides per pair: SortedDict{price: volume}
+        bids_by_pair: Dict[str, SortedDict] = {}
+        asks_by_pair: Dict[str, SortedDict] = {}
+        batch_set = set(batch)  # O(1) membership for subscription acks
+        # last emitted (bid, ask, bid_sz, ask_sz) per pair and when it was sent
+        last_top: Dict[str, Tuple[Tuple, int]] = {}
+        # one quote object per pair, updated in place on every emit
+        quotes: Dict[str, _QuoteCompat] = {p: _QuoteCompat() for p in batch}
         while True:
             try:
                 async with websockets.connect(
@@ -83,6 +125,7 @@ class KrakenMarket:
                     ping_interval=self.PING_INTERVAL,
                     ping_timeout=self.PING_TIMEOUT,
                     max_size=self.MAX_SIZE,
+                    compression=None,
                 ) as ws:
                     chan_to_pair: Dict[int, str] = {}
                     # prepare subscription list
@@ -91,7 +134,7 @@ class KrakenMarket:
                         wsname = self._pair_to_wsname.get(p)
                         if wsname:
                             pair_list.append(wsname)
-                            books[p] = {"bids": {}, "asks": {}}
+                            bids_by_pair[p] = SortedDict(); asks_by_pair[p] = SortedDict()
                     if not pair_list:
                         return
 
@@ -100,11 +143,23 @@ class KrakenMarket:
                         "pair": pair_list,
                         "subscription": {"name": "book", "depth": self.KRAKEN_BOOK_DEPTH},
                     }
-                    await ws.send(json.dumps(sub))
+                    await ws.send(dumps(sub), text=True)
 
-                    async for raw in ws:
+                    # hot-loop lookups bound to locals once per connection
+                    on_quote = self.on_quote
+                    chan_get = chan_to_pair.get
+                    load_side, apply_levels = self._load_side, self._apply_levels
+                    while True:
+                        # raw frame bytes go straight to the parser: no UTF-8 decode to str first
+                        try:
+                            raw = await ws.recv(decode=False)
+                        except websockets.ConnectionClosedOK:
+                            break
+                        # heartbeats ({"event":"heartbeat"}) carry nothing we read: skip the decode
+                        if b'"heartbeat"' in raw[:32]:
+                            continue
                         try:
-                            msg = json.loads(raw)
+                            msg = loads(raw)
                         except Exception:
                             continue
 
@@ -115,7 +170,7 @@ class KrakenMarket:
                                 cid = msg.get("channelID")
                                 wsname = msg.get("pair")
                                 human = _wsname_to_human(wsname) if wsname else None
-                                if cid is not None and human in batch:
+                                if cid is not None and human in batch_set:
                                     chan_to_pair[int(cid)] = human
                             # ignore heartbeats and others
                             continue
@@ -126,7 +181,7 @@ class KrakenMarket:
 
                         cid = msg[0]
                         payload = msg[1]
-                        pair = chan_to_pair.get(int(cid))
+                        pair = chan_get(int(cid))
                         if not pair:
                             continue
                         if payload == "heartbeat":
@@ -136,53 +191,48 @@ class KrakenMarket:
 
                         # Snapshot
                         if "as" in payload or "bs" in payload:
-                            bids, asks = {}, {}
-                            for key, target in (("bs", bids), ("as", asks)):
-                                for lvl in payload.get(key, []):
-                                    try:
-                                        price_str = lvl[0]; vol_str = lvl[1]
-                                        price = float(price_str); vol = float(vol_str)
-                                    except:
-                                        continue
-                                    if vol > 0:
-                                        target[price] = vol
-                            books[pair]["bids"], books[pair]["asks"] = bids, asks
-
-                        # Updates
+                            try:
+                                bids = load_side(payload.get("bs", []))
+                                asks = load_side(payload.get("as", []))
+                            except (TypeError, ValueError, IndexError):
+                                continue
+                            bids_by_pair[pair], asks_by_pair[pair] = bids, asks
+                        else:
+                            bids = bids_by_pair[pair]; asks = asks_by_pair[pair]
+
+                        # Updates; one guard per frame, not per level
                         if "a" in payload or "b" in payload:
-                            for key, name in (("b", "bids"), ("a", "asks")):
-                                for lvl in payload.get(key, []):
-                                    try:
-                                        price_str = lvl[0]; vol_str = lvl[1]
-                                        price = float(price_str); vol = float(vol_str)
-                                    except:
-                                        continue
-                                    if vol <= 0:
-                                        books[pair][name].pop(price, None)
-                                    else:
-                                        books[pair][name][price] = vol
-
-                        bids = books[pair]["bids"]; asks = books[pair]["asks"]
-                        best_bid = max(bids.keys()) if bids else None
-                        best_ask = min(asks.keys()) if asks else None
+                            try:
+                                apply_levels(bids, payload.get("b", []))
+                                apply_levels(asks, payload.get("a", []))
+                            except (TypeError, ValueError, IndexError):
+                                continue
+
+                        # sorted by price: best bid is the last key, best ask the first
+                        best_bid, bid_sz = bids.peekitem(-1) if bids else (None, None)
+                        best_ask, ask_sz = asks.peekitem(0) if asks else (None, None)
                         if best_bid is None and best_ask is None:
                             continue
 
-                        bid_sz = bids.get(best_bid) if best_bid is not None else None
-                        ask_sz = asks.get(best_ask) if best_ask is not None else None
-
-                        # keep raw strings for full precision display
-                        bid_str = f"{best_bid:.12f}" if best_bid is not None else None
-                        ask_str = f"{best_ask:.12f}" if best_ask is not None else None
-
-                        q = _QuoteCompat(
-                            bid=best_bid, ask=best_ask,
-                            bid_sz=bid_sz, ask_sz=ask_sz,
-                            bid_str=bid_str, ask_str=ask_str,
-                            ts_ms=now_ms(),
-                        )
-                        if self.on_quote:
-                            self.on_quote(pair, q)
+                        # skip the emit when only deeper levels moved
+                        top = (best_bid, best_ask, bid_sz, ask_sz)
+                        ts = now_ms()
+                        prev = last_top.get(pair)
+                        if prev is not None and prev[0] == top and ts - prev[1] < self.QUOTE_REFRESH_MS:
+                            continue
+                        last_top[pair] = (top, ts)
+
+                        # shortest round-trip repr: exact for display, no fixed 12-digit padding
+                        bid_str = repr(best_bid) if best_bid is not None else None
+                        ask_str = repr(best_ask) if best_ask is not None else None
+
+                        q = quotes[pair]  # reused per pair; main only keeps the latest quote
+                        q.bid, q.ask = best_bid, best_ask
+                        q.bid_sz, q.ask_sz = bid_sz, ask_sz
+                        q.bid_str, q.ask_str = bid_str, ask_str
+                        q.ts_ms = ts
+                        if on_quote:
+                            on_quote(pair, q)
 
             except Exception as e:
                 print("[kraken] reconnecting after error:", e)
@@ -1,6 +1,14 @@
 # markets/kucoin.py
 import asyncio, aiohttp, websockets, json, time, uuid
-from typing import List, Set, Dict, Optional, Callable
+from typing import List, Set, Dict, Optional, Callable, Tuple
+
+try:
+    import orjson
+    loads, dumps = orjson.loads, orjson.dumps
+except ImportError:  # stdlib fallback
+    loads = json.loads
+    def dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
 
 # -- Quote-compatible object (same fields main expects) --
 class _QuoteCompat:
@@ -12,7 +20,7 @@ class _QuoteCompat:
         self.ts_ms = ts_ms
 
 def now_ms() -> int:
-    return int(time.time() * 1000)
+    return time.time_ns() // 1_000_000
 
 def chunked(seq, n):
     return [seq[i:i+n] for i in range(0, len(seq), n)]
@@ -28,15 +36,59 @@ def kucoin_to_human(symbol: str) -> str:
     except:
         return symbol
 
+_DEPTH5_TOPIC = b'"topic":"/spotMarket/level2Depth5:'
+
+def _head_level(raw: bytes, key: bytes) -> Optional[List[str]]:
+    # first ["price","size"] after key (e.g. b'"bids":[["'), or None if absent / not two strings
+    i = raw.find(key)
+    if i < 0:
+        return None
+    i += len(key)
+    j = raw.find(b'"]', i)
+    if j < 0:
+        return None
+    parts = raw[i:j].split(b'","')
+    if len(parts) != 2:
+        return None
+    return [parts[0].decode(), parts[1].decode()]
+
+def _depth5_head(raw: bytes) -> Optional[Tuple[str, List[str], List[str]]]:
+    """
+    (symbol, best bid level, best ask level) sliced straight out of a level2Depth5 frame,
+    without decoding the other levels. None when the frame doesn't look like that; callers then fall back to loads.
+    """
+    i = raw.find(_DEPTH5_TOPIC)
+    if i < 0:
+        return None
+    i += len(_DEPTH5_TOPIC)
+    j = raw.find(b'"', i)
+    if j < 0:
+        return None
+    bid = _head_level(raw, b'"bids":[["')
+    ask = _head_level(raw, b'"asks":[["')
+    if bid is None or ask is None:
+        return None
+    return raw[i:j].decode(), bid, ask
+
 class KucoinMarket:
     name = "kucoin"
     on_quote: Optional[Callable[[str, _QuoteCompat], None]] = None
+    http: Optional[aiohttp.ClientSession] = None  # shared session (set by main)
 
     # Tunables
     SUB_BATCH = 50           # KuCoin is touchy; keep batches modest
     MAX_SIZE = 2**22
 
     # ========= Discovery =========
+    async def _get_json(self, url: str, timeout: int):
+        """GET url through the shared session, or a one-off session if none was given."""
+        if self.http is not None and not self.http.closed:
+            async with self.http.get(url, timeout=timeout) as r:
+                return await r.json()
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url, timeout=timeout) as r:
+                return await r.json()
+
     async def discover(self, desired_pairs: List[str]) -> Set[str]:
         """
         Return subset of desired_pairs that are enabled for trading on KuCoin.
@@ -46,9 +98,7 @@ class KucoinMarket:
         ok: Set[str] = set()
         mapping: Dict[str, str] = {}
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=25) as r:
-                    j = await r.json()
+            j = await self._get_json(url, timeout=25)
             for d in (j.get("data") or []):
                 if not d.get("enableTrading", False):
                     continue
@@ -80,8 +130,28 @@ class KucoinMarket:
         s = servers[0]
         return s["endpoint"], token, int(s.get("pingInterval", 20000))
 
+    @staticmethod
+    async def _pinger(ws, app_ping_ms: int, ping_id: str):
+        """
+        Send app-level pings until the socket fails; runs as a task per connection.
+        """
+        # keep a small margin below server interval
+        sleep_s = max(5, app_ping_ms/1000 - 2)
+        # KuCoin only echoes the id back; one id per connection is enough
+        ping_frame = dumps({"id": ping_id, "type": "ping"})
+        while True:
+            await asyncio.sleep(sleep_s)
+            try:
+                await ws.send(ping_frame, text=True)
+            except:
+                return
+
     # ========= Consumer =========
     async def _consume(self, batch: List[str]):
+        # kucoin symbol -> pair, built once instead of converting and scanning the batch per message
+        sym_to_pair = {self._pair_to_symbol[p]: p for p in batch if self._pair_to_symbol.get(p)}
+        # one quote object per pair, updated in place on every emit
+        quotes: Dict[str, _QuoteCompat] = {p: _QuoteCompat() for p in batch}
         async with aiohttp.ClientSession() as session:
             while True:
                 try:
@@ -89,88 +159,90 @@ class KucoinMarket:
                     connect_id = str(uuid.uuid4())
                     url = f"{endpoint}?token={token}&connectId={connect_id}"
 
-                    async with websockets.connect(url, max_size=self.MAX_SIZE) as ws:
-                        # Subscribe for each pair in the batch
-                        for p in batch:
-                            sym = self._pair_to_symbol.get(p)
-                            if not sym:
-                                continue
+                    async with websockets.connect(url, max_size=self.MAX_SIZE, compression=None) as ws:
+                        # Subscribe the whole batch in one frame: the topic takes comma-separated symbols (max 100)
+                        if sym_to_pair:
                             sub = {
                                 "id": str(uuid.uuid4()),
                                 "type": "subscribe",
-                                "topic": f"/spotMarket/level2Depth5:{sym}",
+                                "topic": "/spotMarket/level2Depth5:" + ",".join(sym_to_pair),
                                 "privateChannel": False,
                                 "response": True
                             }
-                            await ws.send(json.dumps(sub))
+                            await ws.send(dumps(sub), text=True)
 
                         # App-level ping task (KuCoin requires client pings)
-                        async def pinger():
-                            # keep a small margin below server interval
-                            sleep_s = max(5, app_ping_ms/1000 - 2)
-                            while True:
-                                await asyncio.sleep(sleep_s)
-                                try:
-                                    await ws.send(json.dumps({"id": str(uuid.uuid4()), "type": "ping"}))
-                                except:
-                                    return
-                        ping_task = asyncio.create_task(pinger())
+                        ping_task = asyncio.create_task(self._pinger(ws, app_ping_ms, connect_id))
 
                         try:
-                            async for raw in ws:
+                            # hot-loop lookups bound to locals once per connection
+                            on_quote = self.on_quote
+                            resolve = sym_to_pair.get
+                            while True:
+                                # raw frame bytes go straight to the parser: no UTF-8 decode to str first
                                 try:
-                                    m = json.loads(raw)
-                                except:
+                                    raw = await ws.recv(decode=False)
+                                except websockets.ConnectionClosedOK:
+                                    break
+                                # replies to our pings ({"id":..,"type":"pong"}) carry nothing we read: skip the decode
+                                if raw.endswith(b'"pong"}'):
                                     continue
 
-                                # control msgs
-                                if isinstance(m, dict) and m.get("type") in ("welcome","pong","ack"):
-                                    # you may print acks if debugging:
-                                    # if m["type"] == "ack": print("[kucoin][ack]", m)
-                                    continue
-                                if isinstance(m, dict) and m.get("type") == "error":
-                                    print("[kucoin][error]", m)
-                                    continue
+                                # depth pushes: only the head level of each side is read, so slice it
+                                # out of the bytes; anything else (or an unexpected layout) is fully parsed
+                                head = _depth5_head(raw)
+                                if head is None:
+                                    try:
+                                        m = loads(raw)
+                                    except:
+                                        continue
 
-                                # market data
-                                if isinstance(m, dict) and m.get("type") == "message":
+                                    # one type lookup: market data falls through, control msgs stop here
+                                    typ = m.get("type") if isinstance(m, dict) else None
+                                    if typ != "message":
+                                        # welcome / pong / ack need nothing; you may print acks if debugging:
+                                        # if typ == "ack": print("[kucoin][ack]", m)
+                                        if typ == "error":
+                                            print("[kucoin][error]", m)
+                                        continue
                                     topic = m.get("topic") or ""
                                     if not topic.startswith("/spotMarket/level2Depth5:"):
                                         continue
                                     data = m.get("data") or {}
-                                    sym = topic.split(":", 1)[1]
-                                    pair = kucoin_to_human(sym)
-                                    if pair not in batch:
-                                        continue
-
                                     bids = data.get("bids") or []
                                     asks = data.get("asks") or []
-                                    # keep raw strings to preserve full precision
-                                    try:
-                                        if bids and bids[0]:
-                                            bpx_str, bsz_str = bids[0][0], bids[0][1]
-                                            bpx = float(bpx_str); bsz = float(bsz_str)
-                                        else:
-                                            bpx = bsz = bpx_str = bsz_str = None
-                                        if asks and asks[0]:
-                                            apx_str, asz_str = asks[0][0], asks[0][1]
-                                            apx = float(apx_str); asz = float(asz_str)
-                                        else:
-                                            apx = asz = apx_str = asz_str = None
-                                    except:
-                                        continue
+                                    head = (topic.split(":", 1)[1], bids[0] if bids else None, asks[0] if asks else None)
 
-                                    if bpx is None and apx is None:
-                                        continue
+                                sym, bid_lvl, ask_lvl = head
+                                pair = resolve(sym)
+                                if not pair:
+                                    continue
+
+                                # keep raw strings to preserve full precision
+                                try:
+                                    if bid_lvl:
+                                        bpx_str, bsz_str = bid_lvl[0], bid_lvl[1]
+                                        bpx = float(bpx_str); bsz = float(bsz_str)
+                                    else:
+                                        bpx = bsz = bpx_str = bsz_str = None
+                                    if ask_lvl:
+                                        apx_str, asz_str = ask_lvl[0], ask_lvl[1]
+                                        apx = float(apx_str); asz = float(asz_str)
+                                    else:
+                                        apx = asz = apx_str = asz_str = None
+                                except:
+                                    continue
+
+                                if bpx is None and apx is None:
+                                    continue
 
-                                    q = _QuoteCompat(
-                                        bid=bpx, ask=apx,
-                                        bid_sz=bsz, ask_sz=asz,
-                                        bid_str=bpx_str, ask_str=apx_str,
-                                        ts_ms=now_ms()
-                                    )
-                                    if self.on_quote:
-                                        self.on_quote(pair, q)
+                                q = quotes[pair]  # reused per pair; main only keeps the latest quote
+                                q.bid, q.ask = bpx, apx
+                                q.bid_sz, q.ask_sz = bsz, asz
+                                q.bid_str, q.ask_str = bpx_str, apx_str
+                                q.ts_ms = now_ms()
+                                if on_quote:
+                                    on_quote(pair, q)
                         finally:
                             ping_task.cancel()
                 except Exception as e:
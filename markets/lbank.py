@@ -1,6 +1,15 @@
 # markets/lbank.py
 import asyncio, aiohttp, websockets, json, time
 from typing import List, Set, Dict, Optional, Callable, Tuple
+from sortedcontainers import SortedDict
+
+try:
+    import orjson
+    loads, dumps = orjson.loads, orjson.dumps
+except ImportError:  # stdlib fallback
+    loads = json.loads
+    def dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
 
 # ---------- Quote-compatible object (same fields main expects) ----------
 class _QuoteCompat:
@@ -12,11 +21,13 @@ class _QuoteCompat:
         self.ts_ms = ts_ms
 
 def now_ms() -> int:
-    return int(time.time() * 1000)
+    return time.time_ns() // 1_000_000
 
 def chunked(seq, n):
     return [seq[i:i+n] for i in range(0, len(seq), n)]
 
+PONG_FMT = '{"action":"pong","pong":"%s"}'
+
 def _sym_lb(pair: str) -> str:
     # "ETH/USDT" -> "eth_usdt"
     return pair.replace("/", "_").lower()
@@ -24,6 +35,7 @@ def _sym_lb(pair: str) -> str:
 class LBankMarket:
     name = "lbank"
     on_quote: Optional[Callable[[str, _QuoteCompat], None]] = None
+    http: Optional[aiohttp.ClientSession] = None  # shared session (set by main)
 
     # Tunables
     SUB_BATCH = 35
@@ -31,6 +43,7 @@ class LBankMarket:
     PING_INTERVAL = 20
     PING_TIMEOUT = 20
     LBANK_DEPTH = "1"   # "10" | "50" | "100"
+    FULL_BOOK = False   # True: rebuild a local SortedDict book from every snapshot instead of reading its head
     WS_URL = "wss://www.lbkex.net/ws/V2/"
 
     # ---------- Discovery ----------
@@ -47,14 +60,11 @@ class LBankMarket:
         ]
         avail_syms: Set[str] = set()
         try:
-            async with aiohttp.ClientSession() as session:
-                for url in endpoints:
-                    payload = await self._fetch_json(session, url)
-                    syms = self._extract_pairs(payload)
-                    if syms:
-                        avail_syms = syms
-                        # print(f"[lbank][discover] {url} -> {len(syms)}")
-                        break
+            if self.http is not None and not self.http.closed:
+                avail_syms = await self._probe(self.http, endpoints)
+            else:
+                async with aiohttp.ClientSession() as session:
+                    avail_syms = await self._probe(session, endpoints)
         except Exception as e:
             print("[lbank][discover] error:", e)
 
@@ -64,13 +74,33 @@ class LBankMarket:
                 ok.add(p)
         return ok
 
+    async def _probe(self, session: aiohttp.ClientSession, endpoints: List[str]) -> Set[str]:
+        """
+        Query all endpoints at once; the first one to answer with a non-empty pair list wins.
+        """
+        tasks = [asyncio.ensure_future(self._fetch_json(session, url)) for url in endpoints]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                # keep only base_quote symbols, so a stray text body never counts as a pair list
+                syms = {s for s in self._extract_pairs(await fut) if "_" in s and s.replace("_", "").isalnum()}
+                if syms:
+                    # print(f"[lbank][discover] {len(syms)} pairs")
+                    return syms
+        finally:
+            for t in tasks:
+                t.cancel()
+        return set()
+
     @staticmethod
     async def _fetch_json(session: aiohttp.ClientSession, url: str):
         try:
             async with session.get(url, timeout=20) as r:
+                if not 200 <= r.status < 300:
+                    # error pages (404, Cloudflare HTML) must not win the race in _probe
+                    return None
                 txt = await r.text()  # sometimes text/plain
                 try:
-                    return json.loads(txt)
+                    return loads(txt)
                 except Exception:
                     try:
                         return await r.json(content_type=None)
@@ -127,37 +157,31 @@ class LBankMarket:
 
     # ---------- Helpers ----------
     @staticmethod
-    def _set_level(side: str, book: Dict[str, Dict[str, float]], price: float, size: float):
-        levels = book['bids'] if side == "buy" else book['asks']
-        k = f"{price:.12f}"
-        if size == 0.0:
-            levels.pop(k, None)
-        else:
-            levels[k] = size
+    def _load_side(rows) -> SortedDict:
+        # a whole snapshot side in one pass; float price keys, zero sizes dropped
+        return SortedDict((float(pr), size) for pr, sz in rows if (size := float(sz)) > 0.0)
 
     @staticmethod
-    def _best_levels(book: Dict[str, Dict[str, float]]) -> Tuple[Optional[Tuple[float,float]], Optional[Tuple[float,float]]]:
+    def _best_levels(book: Dict[str, SortedDict]) -> Tuple[Optional[Tuple[float,float]], Optional[Tuple[float,float]]]:
+        # sides are SortedDicts keyed by float price; _load_side never stores a zero size
         bids = book['bids']; asks = book['asks']
-        best_bid = None
-        if bids:
-            pb = max((float(p) for p,s in bids.items() if s > 0.0), default=None)
-            if pb is not None:
-                best_bid = (pb, bids[f"{pb:.12f}"])
-        best_ask = None
-        if asks:
-            pa = min((float(p) for p,s in asks.items() if s > 0.0), default=None)
-            if pa is not None:
-                best_ask = (pa, asks[f"{pa:.12f}"])
+        best_bid = bids.peekitem(-1) if bids else None
+        best_ask = asks.peekitem(0) if asks else None
         return best_bid, best_ask
 
     # ---------- Consumer ----------
     async def _consume(self, batch: List[str]):
-        subs = [
-            {"action":"subscribe","subscribe":"depth","depth":self.LBANK_DEPTH,"pair": _sym_lb(p)}
+        # subscribe frames are fixed per batch: encode them once, not on every reconnect
+        sub_frames = [
+            dumps({"action":"subscribe","subscribe":"depth","depth":self.LBANK_DEPTH,"pair": _sym_lb(p)})
             for p in batch
         ]
-        # per-batch order books
-        books: Dict[str, Dict[str, Dict[str, float]]] = {p: {"bids": {}, "asks": {}} for p in batch}
+        # url symbol -> pair, built once instead of scanning the batch per message
+        sym_to_pair = {_sym_lb(p): p for p in batch}
+        # one quote object per pair, updated in place on every emit
+        quotes: Dict[str, _QuoteCompat] = {p: _QuoteCompat() for p in batch}
+        # per-batch order books (FULL_BOOK only)
+        books: Dict[str, Dict[str, SortedDict]] = {p: {"bids": SortedDict(), "asks": SortedDict()} for p in batch} if self.FULL_BOOK else {}
 
         while True:
             try:
@@ -166,51 +190,63 @@ class LBankMarket:
                     ping_interval=self.PING_INTERVAL,
                     ping_timeout=self.PING_TIMEOUT,
                     max_size=self.MAX_SIZE,
+                    compression=None,
                 ) as ws:
-                    for sub in subs:
-                        await ws.send(json.dumps(sub))
+                    # frames go out together instead of one await each
+                    await asyncio.gather(*(ws.send(f, text=True) for f in sub_frames))
 
-                    async for raw in ws:
+                    # hot-loop lookups bound to locals once per connection
+                    on_quote = self.on_quote
+                    resolve = sym_to_pair.get
+                    load_side, best_levels = self._load_side, self._best_levels
+                    while True:
+                        # raw frame bytes go straight to the parser: no UTF-8 decode to str first
                         try:
-                            data = json.loads(raw)
+                            raw = await ws.recv(decode=False)
+                        except websockets.ConnectionClosedOK:
+                            break
+                        try:
+                            data = loads(raw)
                         except Exception:
                             continue
 
-                        if data.get("action") == "ping":
-                            try:
-                                await ws.send(json.dumps({"action":"pong","pong": data.get("ping")}))
-                            except:
-                                pass
-                            continue
-
+                        # depth pushes first; the only other frame we act on is the server ping
                         if data.get("type") != "depth":
+                            if data.get("action") == "ping":
+                                try:
+                                    # ping ids are plain uuid strings: fill the fixed pong template
+                                    await ws.send(PONG_FMT % data.get("ping"))
+                                except:
+                                    pass
                             continue
 
                         pair_sym = data.get("pair") or ""
-                        pair = next((p for p in batch if _sym_lb(p) == pair_sym), None)
+                        pair = resolve(pair_sym)
                         if not pair:
                             continue
-                        book = books[pair]
 
                         depth = data.get("depth") or {}
                         bids = depth.get("bids") or []
                         asks = depth.get("asks") or []
 
-                        # full snapshot each push → rebuild
-                        book['bids'].clear(); book['asks'].clear()
-                        for pr, sz in bids:
+                        if not self.FULL_BOOK:
+                            # every push is a snapshot sorted best-first: the head of each side is the top
                             try:
-                                self._set_level("buy", book, float(pr), float(sz))
-                            except:
-                                pass
-                        for pr, sz in asks:
+                                bb = (float(bids[0][0]), float(bids[0][1])) if bids else None
+                                aa = (float(asks[0][0]), float(asks[0][1])) if asks else None
+                            except (TypeError, ValueError, IndexError):
+                                continue
+                        else:
+                            book = books[pair]
+                            # full snapshot each push → build fresh sides instead of clear + per-level sets
                             try:
-                                self._set_level("sell", book, float(pr), float(sz))
-                            except:
-                                pass
+                                new_bids = load_side(bids); new_asks = load_side(asks)
+                            except (TypeError, ValueError):
+                                continue
+                            book['bids'], book['asks'] = new_bids, new_asks
+                            bb, aa = best_levels(book)
 
-                        # derive top-of-book and emit
-                        bb, aa = self._best_levels(book)
+                        # emit top-of-book
                         if not (bb or aa):
                             continue
 
@@ -219,17 +255,16 @@ class LBankMarket:
                         ask_px = aa[0] if aa else None
                         ask_sz = aa[1] if aa else None
 
-                        bid_str = f"{bid_px:.12f}" if bid_px is not None else None
-                        ask_str = f"{ask_px:.12f}" if ask_px is not None else None
-
-                        q = _QuoteCompat(
-                            bid=bid_px, ask=ask_px,
-                            bid_sz=bid_sz, ask_sz=ask_sz,
-                            bid_str=bid_str, ask_str=ask_str,
-                            ts_ms=now_ms(),
-                        )
-                        if self.on_quote:
-                            self.on_quote(pair, q)
+                        bid_str = repr(bid_px) if bid_px is not None else None
+                        ask_str = repr(ask_px) if ask_px is not None else None
+
+                        q = quotes[pair]  # reused per pair; main only keeps the latest quote
+                        q.bid, q.ask = bid_px, ask_px
+                        q.bid_sz, q.ask_sz = bid_sz, ask_sz
+                        q.bid_str, q.ask_str = bid_str, ask_str
+                        q.ts_ms = now_ms()
+                        if on_quote:
+                            on_quote(pair, q)
 
             except Exception as e:
                 print("[lbank] reconnecting after error:", e)
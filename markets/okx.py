@@ -1,6 +1,19 @@
 # markets/okx.py
 import asyncio, aiohttp, websockets, json, time
-from typing import List, Set, Dict, Optional, Callable
+from typing import List, Set, Dict, Optional, Callable, Tuple
+
+try:
+    import orjson
+    loads, dumps = orjson.loads, orjson.dumps
+except ImportError:  # stdlib fallback
+    loads = json.loads
+    def dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
+
+try:
+    from fastnumbers import float as _parse_float  # C decimal parser, drop-in for float(str)
+except ImportError:
+    _parse_float = float
 
 # ---------- Quote-compatible object (same fields main expects) ----------
 class _QuoteCompat:
@@ -12,7 +25,7 @@ class _QuoteCompat:
         self.ts_ms = ts_ms
 
 def now_ms() -> int:
-    return int(time.time() * 1000)
+    return time.time_ns() // 1_000_000
 
 def chunked(seq, n):
     return [seq[i:i+n] for i in range(0, len(seq), n)]
@@ -22,27 +35,40 @@ def _sym_okx(pair: str) -> str:
     b, q = pair.split("/")
     return f"{b}-{q}".upper()
 
-def _human_pair(inst_id: str) -> str:
-    try:
-        b, q = inst_id.split("-")
-        return f"{b}/{q}"
-    except:
-        return inst_id
-
 class OkxMarket:
     name = "okx"
     on_quote: Optional[Callable[[str, _QuoteCompat], None]] = None
+    http: Optional[aiohttp.ClientSession] = None  # shared session (set by main)
 
     # Tunables
-    SUB_BATCH = 75
+    SUB_BATCH = 240                    # topics per socket
+    SUB_ARGS_MAX = 75                  # args per subscribe request
+    SUB_PAUSE = 0.2                    # seconds between subscribe requests on one socket (request rate limit)
     MAX_SIZE = 2**22
     PING_INTERVAL = 20
     PING_TIMEOUT = 20
-    OKX_BOOK_CHANNEL = "books5"  # "books", "books5", or "books-l2-tbt"
+    OKX_BOOK_CHANNEL = "bbo-tbt"  # best level per side, pushed per tick; "books5" also works (snapshots, levels 2-5 unused)
     REST_INSTRUMENTS = "https://www.okx.com/api/v5/public/instruments?instType=SPOT"
     WS_URL = "wss://ws.okx.com:8443/ws/v5/public"
+    FLUSH_INTERVAL = 0.02  # seconds between batched on_quote deliveries
+
+    def __init__(self):
+        # newest top per pair since the last flush: (bid, ask, bid_sz, ask_sz, bid_str, ask_str)
+        self._pending: Dict[str, Tuple] = {}
+        # one quote object per pair, updated in place by _flusher
+        self._quotes: Dict[str, _QuoteCompat] = {}
 
     # ---------- Discovery ----------
+    async def _get_json(self, url: str, timeout: int):
+        """GET url through the shared session, or a one-off session if none was given."""
+        # the instrument list is ~100KB: decode it with the same loads as the socket frames
+        if self.http is not None and not self.http.closed:
+            async with self.http.get(url, timeout=timeout) as r:
+                return await r.json(loads=loads)
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url, timeout=timeout) as r:
+                return await r.json(loads=loads)
+
     async def discover(self, desired_pairs: List[str]) -> Set[str]:
         """
         Return subset of desired_pairs supported on OKX Spot, and cache pair->instId.
@@ -50,17 +76,13 @@ class OkxMarket:
         ok: Set[str] = set()
         mapping: Dict[str, str] = {}
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.REST_INSTRUMENTS, timeout=25) as r:
-                    j = await r.json()
+            j = await self._get_json(self.REST_INSTRUMENTS, timeout=25)
             data = j.get("data", []) or []
-            desired = set(desired_pairs)
-            for inst in data:
-                inst_id = inst.get("instId") or ""
-                if not inst_id:
-                    continue
-                human = _human_pair(inst_id)
-                if human in desired:
+            # index the listing once, then probe it per desired pair instead of converting every instrument
+            inst_ids = {inst.get("instId") for inst in data}
+            for human in set(desired_pairs):
+                inst_id = _sym_okx(human)
+                if inst_id in inst_ids:
                     ok.add(human)
                     mapping[human] = inst_id
         except Exception as e:
@@ -71,6 +93,17 @@ class OkxMarket:
 
     # ---------- Consumer ----------
     async def _consume(self, batch: List[str]):
+        # pooled quote per pair (see _flusher)
+        for p in batch:
+            self._quotes[p] = _QuoteCompat()
+        # instId -> pair, built once instead of converting and scanning the batch per message
+        inst_to_pair = {self._pair_to_okx[p]: p for p in batch if self._pair_to_okx.get(p)}
+        if not inst_to_pair:
+            return
+        args = [{"channel": self.OKX_BOOK_CHANNEL, "instId": inst} for inst in inst_to_pair]
+        # one subscribe request per SUB_ARGS_MAX topics; encoded once, reused on reconnect
+        sub_frames = [dumps({"op": "subscribe", "args": a}) for a in chunked(args, self.SUB_ARGS_MAX)]
+
         while True:
             try:
                 async with websockets.connect(
@@ -78,80 +111,95 @@ class OkxMarket:
                     ping_interval=self.PING_INTERVAL,
                     ping_timeout=self.PING_TIMEOUT,
                     max_size=self.MAX_SIZE,
+                    compression=None,
                 ) as ws:
-                    args = []
-                    for p in batch:
-                        inst = self._pair_to_okx.get(p)
-                        if inst:
-                            args.append({"channel": self.OKX_BOOK_CHANNEL, "instId": inst})
-                    if not args:
-                        return
-
-                    sub = {"op": "subscribe", "args": args}
-                    await ws.send(json.dumps(sub))
-
-                    async for raw in ws:
-                        try:
-                            msg = json.loads(raw)
-                        except Exception:
-                            continue
-
-                        # Ignore control events/acks
-                        if isinstance(msg, dict) and "event" in msg:
-                            continue
+                    await self._subscribe_in_chunks(ws, sub_frames)
 
-                        if not (isinstance(msg, dict) and "arg" in msg and "data" in msg):
-                            continue
-
-                        inst_id = msg["arg"].get("instId")
-                        if not inst_id:
+                    resolve = inst_to_pair.get  # bound once per connection
+                    to_float = _parse_float
+                    while True:
+                        # raw frame bytes go straight to the parser: no UTF-8 decode to str first
+                        try:
+                            raw = await ws.recv(decode=False)
+                        except websockets.ConnectionClosedOK:
+                            break
+                        # acks/errors ({"event":...}) and text pongs carry nothing we read: skip the decode
+                        if raw.startswith(b'{"event"') or raw == b"pong":
                             continue
-                        pair = _human_pair(inst_id)
-                        if pair not in batch:
+                        try:
+                            msg = loads(raw)
+                        except Exception:
                             continue
 
-                        data_list = msg.get("data") or []
+                        # book pushes carry "arg" + "data"; anything else stops here
+                        data_list = msg.get("data") if isinstance(msg, dict) else None
                         if not data_list:
                             continue
+                        arg = msg.get("arg")
+                        pair = resolve(arg.get("instId")) if arg else None
+                        if not pair:
+                            continue
                         d0 = data_list[-1]  # take latest snapshot in the array
 
-                        bids = d0.get("bids") or []
-                        asks = d0.get("asks") or []
+                        bids = d0.get("bids")
+                        asks = d0.get("asks")
+                        if not bids and not asks:
+                            continue
 
-                        # OKX books entries are arrays like [price, size, ..., ...] (strings)
+                        # OKX books entries are arrays like [price, size, ..., ...] (strings):
+                        # the price string is kept as delivered, no str() copy
                         bid_px = bid_sz = ask_px = ask_sz = None
-                        bid_px_str = bid_sz_str = ask_px_str = ask_sz_str = None
+                        bid_px_str = ask_px_str = None
                         try:
-                            if bids and bids[0]:
-                                bid_px_str = str(bids[0][0])
-                                bid_sz_str = str(bids[0][1])
-                                bid_px = float(bid_px_str)
-                                bid_sz = float(bid_sz_str)
-                            if asks and asks[0]:
-                                ask_px_str = str(asks[0][0])
-                                ask_sz_str = str(asks[0][1])
-                                ask_px = float(ask_px_str)
-                                ask_sz = float(ask_sz_str)
-                        except Exception:
-                            # if parsing fails, skip this frame
+                            if bids:
+                                b0 = bids[0]
+                                if b0:
+                                    bid_px_str = b0[0]
+                                    bid_px = to_float(bid_px_str); bid_sz = to_float(b0[1])
+                            if asks:
+                                a0 = asks[0]
+                                if a0:
+                                    ask_px_str = a0[0]
+                                    ask_px = to_float(ask_px_str); ask_sz = to_float(a0[1])
+                        except (TypeError, ValueError, IndexError):
+                            # malformed level: skip this frame
                             continue
 
                         if bid_px is None and ask_px is None:
                             continue
 
-                        q = _QuoteCompat(
-                            bid=bid_px, ask=ask_px,
-                            bid_sz=bid_sz, ask_sz=ask_sz,
-                            bid_str=bid_px_str, ask_str=ask_px_str,
-                            ts_ms=now_ms(),
-                        )
-                        if self.on_quote:
-                            self.on_quote(pair, q)
+                        # hand off to _flusher: the read loop never runs the downstream callback
+                        self._pending[pair] = (bid_px, ask_px, bid_sz, ask_sz, bid_px_str, ask_px_str)
 
             except Exception as e:
                 print("[okx] reconnecting after error:", e)
                 await asyncio.sleep(3)
 
+    async def _subscribe_in_chunks(self, ws, frames: List[bytes]) -> None:
+        # OKX rate-limits subscribe requests, not sockets: pace the frames instead of opening more connections
+        for i, f in enumerate(frames):
+            if i:
+                await asyncio.sleep(self.SUB_PAUSE)
+            await ws.send(f, text=True)
+
+    async def _flusher(self):
+        """Deliver the newest top per pair once per FLUSH_INTERVAL."""
+        quotes = self._quotes
+        while True:
+            await asyncio.sleep(self.FLUSH_INTERVAL)
+            if not self._pending or not self.on_quote:
+                continue
+            pending, self._pending = self._pending, {}
+            on_quote = self.on_quote
+            ts = now_ms()  # one clock read per flush, not per frame
+            for pair, (bid, ask, bid_sz, ask_sz, bid_str, ask_str) in pending.items():
+                q = quotes[pair]  # reused per pair; main only keeps the latest quote
+                q.bid, q.ask = bid, ask
+                q.bid_sz, q.ask_sz = bid_sz, ask_sz
+                q.bid_str, q.ask_str = bid_str, ask_str
+                q.ts_ms = ts
+                on_quote(pair, q)
+
     # ---------- Runner ----------
     async def run(self, pairs: List[str]) -> None:
         # ensure mapping present even if discover() skipped
@@ -163,7 +211,7 @@ class OkxMarket:
         if not pairs:
             return
         batches = chunked(sorted(pairs), self.SUB_BATCH)
-        await asyncio.gather(*(self._consume(b) for b in batches))
+        await asyncio.gather(self._flusher(), *(self._consume(b) for b in batches))
 
 # Entry point factory for main.py
 def MARKET_CLASS():